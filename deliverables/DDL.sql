@@ -4,7 +4,7 @@ CREATE OR REPLACE TABLE dim_categories (
     category_name VARCHAR(128)
 );
 
--- dim_time
+-- dim_time (calendar, id is the YYYYMMDD integer of the date)
 CREATE OR REPLACE TABLE dim_time (
     id INT PRIMARY KEY,
     year INT,
@@ -12,6 +12,17 @@ CREATE OR REPLACE TABLE dim_time (
     day INT
 );
 
+-- seed every day from 2020 to 2035 once, the transformer computes date ids without reading dim_time
+INSERT INTO dim_time (id, year, month, day)
+SELECT TO_NUMBER(TO_CHAR(d, 'YYYYMMDD')), YEAR(d), MONTH(d), DAY(d)
+FROM (
+    SELECT DATEADD(day, ROW_NUMBER() OVER (ORDER BY SEQ4()) - 1, '2020-01-01'::DATE) AS d
+    FROM TABLE(GENERATOR(ROWCOUNT => 5844))
+);
+
+-- migrating a warehouse loaded with the former sequential date ids, before re-creating dim_time:
+-- UPDATE fact_sales fs SET date_id = dt.year * 10000 + dt.month * 100 + dt.day FROM dim_time dt WHERE fs.date_id = dt.id;
+
 -- dim_products
 CREATE OR REPLACE TABLE dim_products (
     id VARCHAR(128) PRIMARY KEY,
@@ -27,4 +38,45 @@ CREATE OR REPLACE TABLE fact_sales (
     sales DOUBLE,
     quantity INT,
     date_id INT FOREIGN KEY REFERENCES dim_time (id) NOT ENFORCED
-);
\ No newline at end of file
+);
+
+-- load_ledger (one row per source file loaded into fact_sales, etag tells a replay from a regenerated file)
+CREATE OR REPLACE TABLE load_ledger (
+    source_file VARCHAR(512) PRIMARY KEY,
+    etag VARCHAR(128),
+    row_count INT,
+    loaded_at TIMESTAMP
+);
+
+-- migrating an existing ledger (its files are loaded once more on their next run, replacing their dates):
+-- ALTER TABLE load_ledger ADD COLUMN etag VARCHAR(128);
+
+-- agg_sales_product_daily (sales of a product in a day, maintained by the transformer)
+CREATE OR REPLACE TABLE agg_sales_product_daily (
+    product_id VARCHAR(128) FOREIGN KEY REFERENCES dim_products (id) NOT ENFORCED,
+    date_id INT FOREIGN KEY REFERENCES dim_time (id) NOT ENFORCED,
+    total_sales DOUBLE,
+    total_quantity INT,
+    tickets INT
+);
+
+-- agg_sales_category_daily (sales of a category in a day, maintained by the transformer)
+CREATE OR REPLACE TABLE agg_sales_category_daily (
+    category_id INT FOREIGN KEY REFERENCES dim_categories (id) NOT ENFORCED,
+    date_id INT FOREIGN KEY REFERENCES dim_time (id) NOT ENFORCED,
+    total_sales DOUBLE,
+    total_quantity INT,
+    tickets INT
+);
+
+-- backfill the aggregates from an existing fact_sales (the transformer only refreshes the dates it loads)
+INSERT INTO agg_sales_product_daily (product_id, date_id, total_sales, total_quantity, tickets)
+SELECT product_id, date_id, SUM(sales), SUM(quantity), COUNT(*)
+FROM fact_sales
+GROUP BY product_id, date_id;
+
+INSERT INTO agg_sales_category_daily (category_id, date_id, total_sales, total_quantity, tickets)
+SELECT dp.category_id, apd.date_id, SUM(apd.total_sales), SUM(apd.total_quantity), SUM(apd.tickets)
+FROM agg_sales_product_daily apd
+LEFT JOIN dim_products dp ON apd.product_id = dp.id
+GROUP BY dp.category_id, apd.date_id;
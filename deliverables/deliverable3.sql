@@ -1,46 +1,47 @@
+-- The reports read the daily aggregates maintained by the transformer (see DDL.sql),
+-- their cost does not depend on the size of fact_sales
+
 -- Query the top 5 sales by product
-SELECT dp.title, SUM(fs.sales) as total_sales
-FROM fact_sales fs
-LEFT JOIN dim_products dp ON fs.product_id = dp.id
+SELECT dp.title, SUM(apd.total_sales) as total_sales
+FROM agg_sales_product_daily apd
+LEFT JOIN dim_products dp ON apd.product_id = dp.id
 GROUP BY dp.title
 ORDER BY total_sales DESC
 LIMIT 5;
 
 -- Query the top 5 sales by category agrupation
-SELECT dc.category_name, SUM(fs.sales) as total_sales
-FROM fact_sales fs
-LEFT JOIN dim_products dp ON fs.product_id = dp.id
-LEFT JOIN dim_categories dc ON dp.category_id = dc.id
+SELECT dc.category_name, SUM(acd.total_sales) as total_sales
+FROM agg_sales_category_daily acd
+LEFT JOIN dim_categories dc ON acd.category_id = dc.id
 GROUP BY dc.category_name
 ORDER BY total_sales DESC
 LIMIT 5;
 
 -- Query the least 5 sales by category agrupation
-SELECT dc.category_name, SUM(fs.sales) as total_sales
-FROM fact_sales fs
-LEFT JOIN dim_products dp ON fs.product_id = dp.id
-LEFT JOIN dim_categories dc ON dp.category_id = dc.id
+SELECT dc.category_name, SUM(acd.total_sales) as total_sales
+FROM agg_sales_category_daily acd
+LEFT JOIN dim_categories dc ON acd.category_id = dc.id
 GROUP BY dc.category_name
 ORDER BY total_sales ASC
 LIMIT 5;
 
 -- Query the top 5 sales by title and subtitle agrupation
-SELECT dp.title, dp.subtitle, SUM(fs.sales) as total_sales
-FROM fact_sales fs
-LEFT JOIN dim_products dp ON fs.product_id = dp.id
+SELECT dp.title, dp.subtitle, SUM(apd.total_sales) as total_sales
+FROM agg_sales_product_daily apd
+LEFT JOIN dim_products dp ON apd.product_id = dp.id
 GROUP BY dp.title, dp.subtitle
 ORDER BY total_sales DESC
 LIMIT 5;
 
 -- Query the top 3 products that has greatest sales per category (using window function)
 WITH CAT_RANK AS 
-(SELECT dc.category_name, dp.title, SUM(fs.sales) as total_sales, RANK() OVER(PARTITION BY dc.category_name ORDER BY total_sales DESC) as ranking
-FROM fact_sales fs
-LEFT JOIN dim_products dp ON fs.product_id = dp.id
+(SELECT dc.category_name, dp.title, SUM(apd.total_sales) as total_sales, RANK() OVER(PARTITION BY dc.category_name ORDER BY total_sales DESC) as ranking
+FROM agg_sales_product_daily apd
+LEFT JOIN dim_products dp ON apd.product_id = dp.id
 LEFT JOIN dim_categories dc ON dp.category_id = dc.id
 GROUP BY dc.category_name, dp.title)
 
 SELECT * exclude(ranking)
 FROM CAT_RANK
 WHERE ranking <= 3
-ORDER BY category_name, ranking;
\ No newline at end of file
+ORDER BY category_name, ranking;
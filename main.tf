@@ -3,14 +3,21 @@ provider "aws" {
   region  = "us-east-1"
 }
 
+# Create AWS Lambda Layer - Shared column schema
+module "schemaLayer" {
+  source = "./schema-layer"
+}
+
 # Create AWS Python Lambda Function - Scrapper
 module "scrapperLambdaFunction" {
   source = "./scrapper-aws"
+  schema_layer_arn = module.schemaLayer.layer_arn
 }
 
 # Create AWS Python Lambda Function - Transformer
 module "transformerLambdaFunction" {
   source = "./transformer"
+  schema_layer_arn = module.schemaLayer.layer_arn
 }
 
 # Create AWS Stepfunction to Invoke AWS Lambda Functions
@@ -0,0 +1,206 @@
+"""
+Runs the report queries of deliverables/deliverable3.sql straight on the data lake with DuckDB,
+no warehouse needed. The lake is the raw/ layout written by the scrapper:
+
+    raw/data/products/<prefix>.csv|.parquet
+    raw/data/sales/YYYY/MM/DD/nike_sales_YYYY_MM_DD.csv|.parquet
+
+Only the YYYY/MM/DD folders between start and end are read, and only the columns the reports use.
+
+    python reports/lake_reports.py /path/to/lake --start 2024-01-01 --end 2024-01-31
+    python reports/lake_reports.py s3://enroute-project --format parquet
+
+s3:// locations use the DuckDB httpfs extension, S3_ENDPOINT points it to an S3 stand-in (MinIO, ...)
+"""
+import argparse
+import os
+import re
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+import duckdb
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'schema-layer', 'layer-files', 'python'))
+from nike_schema import PRODUCT_FIELDS, SALES_FIELDS
+
+# shared schema type -> DuckDB type of the CSV readers
+DUCKDB_TYPES = {
+    'string': 'VARCHAR', 'category': 'VARCHAR', 'bool': 'BOOLEAN', 'int32': 'INTEGER',
+    'int64': 'BIGINT', 'float64': 'DOUBLE', 'date': 'DATE',
+}
+
+# the queries of deliverable3.sql, 'products' stands for dim_products/dim_categories and 'sales' for fact_sales
+REPORTS = {
+    'top 5 sales by product': """
+        SELECT p.title, SUM(s.sales) AS total_sales
+        FROM sales s LEFT JOIN products p ON s.UID = p.UID
+        GROUP BY p.title
+        ORDER BY total_sales DESC
+        LIMIT 5
+    """,
+    'top 5 sales by category': """
+        SELECT p.category AS category_name, SUM(s.sales) AS total_sales
+        FROM sales s LEFT JOIN products p ON s.UID = p.UID
+        GROUP BY p.category
+        ORDER BY total_sales DESC
+        LIMIT 5
+    """,
+    'least 5 sales by category': """
+        SELECT p.category AS category_name, SUM(s.sales) AS total_sales
+        FROM sales s LEFT JOIN products p ON s.UID = p.UID
+        GROUP BY p.category
+        ORDER BY total_sales ASC
+        LIMIT 5
+    """,
+    'top 5 sales by title and subtitle': """
+        SELECT p.title, p.subtitle, SUM(s.sales) AS total_sales
+        FROM sales s LEFT JOIN products p ON s.UID = p.UID
+        GROUP BY p.title, p.subtitle
+        ORDER BY total_sales DESC
+        LIMIT 5
+    """,
+    'top 3 products per category': """
+        WITH CAT_RANK AS (
+            SELECT p.category AS category_name, p.title, SUM(s.sales) AS total_sales,
+                   RANK() OVER (PARTITION BY p.category ORDER BY SUM(s.sales) DESC) AS ranking
+            FROM sales s LEFT JOIN products p ON s.UID = p.UID
+            GROUP BY p.category, p.title
+        )
+        SELECT * EXCLUDE (ranking)
+        FROM CAT_RANK
+        WHERE ranking <= 3
+        ORDER BY category_name, ranking
+    """,
+}
+
+# columns read from the lake files
+PRODUCT_COLUMNS = ['UID', 'productID', 'title', 'subtitle', 'category']
+SALES_COLUMNS = ['UID', 'sales']
+
+# timestamp the scrapper appends to the products file names, e.g. nike_17OCT2024_0930.csv
+PRODUCTS_TIMESTAMP = re.compile(r'_(\d{2}[A-Za-z]{3}\d{4}_\d{4})')
+
+
+def connect(lake: str):
+    connection = duckdb.connect()
+    if lake.startswith('s3://'):
+        connection.execute("INSTALL httpfs")
+        connection.execute("LOAD httpfs")
+        if os.environ.get('S3_ENDPOINT'):
+            connection.execute(f"SET s3_endpoint = '{os.environ['S3_ENDPOINT']}'")
+            connection.execute("SET s3_url_style = 'path'")
+            connection.execute("SET s3_use_ssl = false")
+        connection.execute(f"SET s3_region = '{os.environ.get('AWS_DEFAULT_REGION', 'us-east-1')}'")
+        for setting, variable in (('s3_access_key_id', 'AWS_ACCESS_KEY_ID'), ('s3_secret_access_key', 'AWS_SECRET_ACCESS_KEY')):
+            if os.environ.get(variable):
+                connection.execute(f"SET {setting} = '{os.environ[variable]}'")
+    return connection
+
+
+def glob_files(connection, pattern: str):
+    return sorted(row[0] for row in connection.execute("SELECT file FROM glob(?)", [pattern]).fetchall())
+
+
+def sales_files(connection, lake: str, extension: str, start: date = None, end: date = None):
+    """
+    files of the YYYY/MM/DD sales partitions between start and end (all of them by default),
+    only the month folders of the range are listed
+    """
+    root = f"{lake.rstrip('/')}/raw/data/sales"
+    if start is None or end is None:
+        patterns = [f"{root}/*/*/*/*{extension}"]
+    else:
+        months = sorted({(start + timedelta(n)).strftime('%Y/%m') for n in range((end - start).days + 1)})
+        patterns = [f"{root}/{month}/*/*{extension}" for month in months]
+
+    files = []
+    for pattern in patterns:
+        for path in glob_files(connection, pattern):
+            year, month, day = path.replace('\\', '/').split('/')[-4:-1]
+            partition = date(int(year), int(month), int(day))
+            if (start is None or partition >= start) and (end is None or partition <= end):
+                files.append(path)
+    return files
+
+
+def newest_first(files: list):
+    """
+    products files ordered by the scrape timestamp of their name, newest first.
+    Files without a timestamp go last, by name
+    """
+    def scraped_at(path):
+        match = PRODUCTS_TIMESTAMP.search(os.path.basename(path))
+        try:
+            return datetime.strptime(match.group(1), '%d%b%Y_%H%M') if match else datetime.min
+        except ValueError:
+            return datetime.min
+    return sorted(files, key=lambda path: (scraped_at(path), path), reverse=True)
+
+
+def scan(files: list, extension: str, fields: list, columns: list, filename=False):
+    """
+    SQL reading the projected columns of lake files, CSV files get the column types of the shared schema.
+    filename: adds the path of the file of every row as a filename column
+    """
+    paths = ', '.join(f"'{path}'" for path in files)
+    projection = ', '.join(f'"{column}"' for column in columns + (['filename'] if filename else []))
+    options = ', filename = true' if filename else ''
+    if extension == '.parquet':
+        return f"SELECT {projection} FROM read_parquet([{paths}], union_by_name = true{options})"
+    types = ', '.join(f"'{name}': '{DUCKDB_TYPES[kind]}'" for name, kind in fields)
+    return f"SELECT {projection} FROM read_csv([{paths}], header = true, columns = {{{types}}}{options})"
+
+
+def run_reports(lake: str, output_format: str = 'csv', start: date = None, end: date = None):
+    """
+    returns {report name: DataFrame} and the timings of the run
+    """
+    extension = '.parquet' if output_format == 'parquet' else '.csv'
+    timings = {}
+    begin = time.perf_counter()
+    connection = connect(lake)
+
+    products = glob_files(connection, f"{lake.rstrip('/')}/raw/data/products/*{extension}")
+    sales = sales_files(connection, lake, extension, start, end)
+    timings['list_seconds'] = round(time.perf_counter() - begin, 3)
+    if not products or not sales:
+        raise FileNotFoundError(f"No {output_format} products or sales files under {lake} for the requested dates")
+
+    # a UID appears in every products file that scraped it, the row of the newest file is kept
+    recency = ', '.join(f"('{path}', {n})" for n, path in enumerate(newest_first(products)))
+    connection.execute(
+        "CREATE VIEW products AS SELECT DISTINCT ON (p.UID) p.* EXCLUDE (filename) FROM ("
+        + scan(products, extension, PRODUCT_FIELDS, PRODUCT_COLUMNS, filename=True)
+        + f") p JOIN (VALUES {recency}) AS f(filename, recency) ON p.filename = f.filename"
+        + " ORDER BY p.UID, f.recency"
+    )
+    connection.execute("CREATE VIEW sales AS " + scan(sales, extension, SALES_FIELDS, SALES_COLUMNS))
+
+    results = {}
+    for name, query in REPORTS.items():
+        started = time.perf_counter()
+        results[name] = connection.execute(query).df()
+        timings[name] = round(time.perf_counter() - started, 3)
+    timings['files'] = {'products': len(products), 'sales': len(sales)}
+    timings['total_seconds'] = round(time.perf_counter() - begin, 3)
+    return results, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the deliverable3 reports on the data lake")
+    parser.add_argument('lake', help="folder or s3://bucket holding the raw/ layout")
+    parser.add_argument('--format', default='csv', choices=['csv', 'parquet'], help="lake files format")
+    parser.add_argument('--start', type=date.fromisoformat, help="first sales day (YYYY-MM-DD)")
+    parser.add_argument('--end', type=date.fromisoformat, help="last sales day (YYYY-MM-DD)")
+    args = parser.parse_args()
+
+    results, timings = run_reports(args.lake, args.format, args.start, args.end)
+    for name, df in results.items():
+        print(f"\n-- {name}")
+        print(df.to_string(index=False))
+    print(f"\n{timings}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,19 @@
+# Create a zip archive from the shared modules (Lambda layers expect them under python/)
+data "archive_file" "schema_layer_source" {
+  type        = "zip"
+  source_dir  = "${path.module}/layer-files"  # Path to the layer directory
+  output_path = "${path.module}/schema-layer.zip"
+}
+
+# Shared column schema and run metrics used by the scrapper and the transformer
+resource "aws_lambda_layer_version" "schema_layer" {
+  layer_name          = "Enroute-Nike-Schema"  # Name of the Lambda layer
+  filename            = data.archive_file.schema_layer_source.output_path  # Path to the layer package
+  source_code_hash    = data.archive_file.schema_layer_source.output_base64sha256  # Hash of the layer code
+  compatible_runtimes = ["python3.11"]
+}
+
+# Output to be consumed by other module
+output "layer_arn" {
+  value = aws_lambda_layer_version.schema_layer.arn
+}
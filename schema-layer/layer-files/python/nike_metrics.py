@@ -0,0 +1,177 @@
+import json
+import os
+import time
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from threading import Lock
+
+# Run metrics shared by the scraper and the transformer (Lambda layer, see schema-layer/).
+# Metrics collects stage timings, counters and latency histograms during a run, flush() emits them
+# as one CloudWatch Embedded Metric Format (EMF) record: a JSON log line CloudWatch turns into metrics.
+# Without a sink every call returns right away, so instrumented code costs next to nothing.
+
+NAMESPACE = 'EnrouteNike'
+
+# upper bounds (milliseconds) of the latency histogram buckets, the last bucket has no bound
+LATENCY_BOUNDS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+# context manager handed out by stage() when metrics are disabled
+_NO_STAGE = nullcontext()
+
+
+def emf_sink(record: dict):
+    """
+    prints the record on one line, Lambda sends stdout to CloudWatch Logs where EMF records become metrics
+    """
+    print(json.dumps(record, separators=(',', ':'), default=str))
+
+
+class MemorySink():
+    """
+    keeps the records in memory (benchmarks, local runs)
+    """
+    def __init__(self):
+        self.records = []
+
+    def __call__(self, record: dict):
+        self.records.append(record)
+
+
+class Metrics():
+    """
+    Metrics of a run, emitted as a single EMF record by flush()
+    namespace: CloudWatch namespace
+    dimensions: {name: value} of every metric, e.g. {'Function': 'scrapper'}
+    sink: callable receiving the EMF record, None disables the metrics (no-op)
+    """
+    def __init__(self, namespace: str = NAMESPACE, dimensions: dict = None, sink=None):
+        self.namespace = namespace
+        self.dimensions = dict(dimensions or {})
+        self.sink = sink
+        self.enabled = sink is not None
+        self.__lock = Lock()
+        self.reset()
+
+    @classmethod
+    def from_env(cls, dimensions: dict = None, namespace: str = NAMESPACE):
+        """
+        METRICS_SINK environment variable: 'emf' (default) prints EMF records, 'off' disables the metrics
+        """
+        sink = None if os.environ.get('METRICS_SINK', 'emf').lower() == 'off' else emf_sink
+        return cls(namespace, dimensions, sink)
+
+    def reset(self):
+        """
+        drops everything recorded since the last flush
+        """
+        with self.__lock:
+            self.__values = {}
+            self.__histograms = {}
+            self.__properties = {}
+
+    def stage(self, name: str):
+        """
+        context manager adding the seconds spent in its block to the <name>Seconds metric
+        """
+        if not self.enabled:
+            return _NO_STAGE
+        return self.__timer(name)
+
+    @contextmanager
+    def __timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(f'{name}Seconds', time.perf_counter() - start, 'Seconds')
+
+    def add(self, name: str, value=1, unit: str = 'Count'):
+        """
+        adds value to a counter
+        """
+        if not self.enabled:
+            return
+        with self.__lock:
+            total, _ = self.__values.get(name, (0, unit))
+            self.__values[name] = (total + value, unit)
+
+    def set(self, name: str, value, unit: str = 'None'):
+        """
+        sets a gauge, the last value wins
+        """
+        if not self.enabled:
+            return
+        with self.__lock:
+            self.__values[name] = (value, unit)
+
+    def observe(self, name: str, seconds):
+        """
+        adds latencies (an iterable of seconds) to a histogram
+        """
+        if not self.enabled:
+            return
+        buckets = [0] * (len(LATENCY_BOUNDS_MS) + 1)
+        for value in seconds:
+            buckets[bisect_left(LATENCY_BOUNDS_MS, value * 1000)] += 1
+        with self.__lock:
+            counts = self.__histograms.setdefault(name, [0] * len(buckets))
+            for n, count in enumerate(buckets):
+                counts[n] += count
+
+    def property(self, name: str, value):
+        """
+        sets a field of the record that is not a metric (searchable in CloudWatch Logs Insights)
+        """
+        if not self.enabled:
+            return
+        with self.__lock:
+            self.__properties[name] = value
+
+    def __percentile(self, counts, share):
+        """
+        upper bound of the bucket holding the share-th latency (the last bound for the unbounded bucket)
+        """
+        target = share * sum(counts)
+        seen = 0
+        for n, count in enumerate(counts):
+            seen += count
+            if count and seen >= target:
+                return LATENCY_BOUNDS_MS[min(n, len(LATENCY_BOUNDS_MS) - 1)]
+        return 0
+
+    def flush(self):
+        """
+        emits everything recorded since the last flush as one EMF record and resets the metrics.
+        Returns the record (None when disabled or empty)
+        """
+        if not self.enabled:
+            return None
+        with self.__lock:
+            values, histograms, properties = self.__values, self.__histograms, self.__properties
+        self.reset()
+        if not values and not histograms:
+            return None
+
+        record = dict(self.dimensions)
+        definitions = []
+        for name, (value, unit) in values.items():
+            record[name] = round(value, 6) if isinstance(value, float) else value
+            definitions.append({'Name': name, 'Unit': unit})
+        for name, counts in histograms.items():
+            record[f'{name}Count'] = sum(counts)
+            definitions.append({'Name': f'{name}Count', 'Unit': 'Count'})
+            for label, share in (('P50', 0.5), ('P95', 0.95), ('P99', 0.99)):
+                record[f'{name}{label}'] = self.__percentile(counts, share)
+                definitions.append({'Name': f'{name}{label}', 'Unit': 'Milliseconds'})
+            record[f'{name}Histogram'] = {'boundsMs': LATENCY_BOUNDS_MS, 'counts': counts}
+        record.update(properties)
+        record['_aws'] = {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': self.namespace,
+                'Dimensions': [list(self.dimensions)],
+                'Metrics': definitions,
+            }],
+        }
+        self.sink(record)
+        return record
@@ -0,0 +1,100 @@
+import pandas as pd
+
+# Column schema shared by the scraper and the transformer (Lambda layer, see schema-layer/).
+# Each dataset is a list of (column, type), types are:
+#   string, category (low cardinality strings), bool (nullable), int32, int64, float64, date
+# Prices and amounts stay float64, float32 would change the cents of the generated sales
+
+# raw/data/products/
+PRODUCT_FIELDS = [
+    ('UID', 'string'), ('cloudProdID', 'string'), ('productID', 'string'), ('shortID', 'string'),
+    ('colorNum', 'int32'), ('title', 'string'), ('subtitle', 'string'), ('category', 'category'),
+    ('type', 'category'), ('currency', 'category'), ('fullPrice', 'float64'), ('currentPrice', 'float64'),
+    ('sale', 'bool'), ('TopColor', 'string'), ('channel', 'category'), ('short_description', 'string'),
+    ('rating', 'string'),
+
+    ('customizable', 'bool'), ('ExtendedSizing', 'bool'), ('inStock', 'bool'), ('ComingSoon', 'bool'),
+    ('BestSeller', 'bool'), ('Excluded', 'bool'), ('GiftCard', 'bool'), ('Jersey', 'bool'),
+    ('Launch', 'bool'), ('MemberExclusive', 'bool'), ('NBA', 'bool'), ('NFL', 'bool'),
+    ('Sustainable', 'bool'), ('label', 'category'), ('prebuildId', 'string'), ('prod_url', 'string'),
+
+    ('color-ID', 'string'), ('color-Description', 'string'), ('color-FullPrice', 'float64'),
+    ('color-CurrentPrice', 'float64'), ('color-Discount', 'bool'), ('color-BestSeller', 'bool'),
+    ('color-InStock', 'bool'), ('color-MemberExclusive', 'bool'), ('color-New', 'bool'),
+    ('color-Label', 'category'), ('color-Image-url', 'string'),
+]
+
+# raw/data/sales/YYYY/MM/DD/
+SALES_FIELDS = [
+    ('ticket_id', 'int64'), ('UID', 'string'), ('currency', 'category'),
+    ('sales', 'float64'), ('quantity', 'int32'), ('date', 'date'),
+]
+
+# Rows staged into the warehouse fact_sales table
+FACT_SALES_FIELDS = [
+    ('ticket_id', 'int64'), ('product_id', 'string'), ('sales', 'float64'),
+    ('quantity', 'int32'), ('date_id', 'int32'),
+]
+
+# type -> pandas dtype in memory
+PANDAS_TYPES = {
+    'string': 'string',
+    'category': 'category',
+    'bool': 'boolean',
+    'int32': 'int32',
+    'int64': 'int64',
+    'float64': 'float64',
+    'date': 'datetime64[ns]',
+}
+
+
+def column_names(fields: list):
+    return [name for name, _ in fields]
+
+
+def read_dtypes(fields: list, columns: list = None):
+    """
+    dtype argument of pd.read_csv for the columns of fields (all by default), so readers skip
+    type inference. Dates are read as strings, coerce parses them
+    """
+    kinds = dict(fields)
+    return {
+        name: 'string' if kinds[name] == 'date' else PANDAS_TYPES[kinds[name]]
+        for name in (columns or column_names(fields))
+    }
+
+
+def coerce(df: pd.DataFrame, fields: list):
+    """
+    returns the columns of fields present in df, in schema order, cast to their compact dtypes
+    """
+    columns = {}
+    for name, kind in fields:
+        if name not in df.columns:
+            continue
+        column = df[name]
+        if str(column.dtype) == PANDAS_TYPES[kind]:
+            columns[name] = column
+        elif kind == 'date':
+            columns[name] = pd.to_datetime(column)
+        elif kind == 'category':
+            # values such as salesChannel lists are kept as their text, like in the CSV files
+            columns[name] = column.astype('string').astype('category')
+        else:
+            columns[name] = column.astype(PANDAS_TYPES[kind])
+    return pd.DataFrame(columns, index=df.index)
+
+
+def validate(df: pd.DataFrame, fields: list, columns: list = None):
+    """
+    raises ValueError when df misses a column of fields (or of columns) or holds it with another dtype
+    """
+    kinds = dict(fields)
+    errors = []
+    for name in (columns or column_names(fields)):
+        if name not in df.columns:
+            errors.append(f"missing column '{name}'")
+        elif str(df[name].dtype) != PANDAS_TYPES[kinds[name]]:
+            errors.append(f"column '{name}' is {df[name].dtype}, expected {PANDAS_TYPES[kinds[name]]}")
+    if errors:
+        raise ValueError("Schema mismatch: " + ', '.join(errors))
@@ -1,3 +1,6 @@
+# Shared column schema layer
+variable "schema_layer_arn" {}
+
 # IAM role for lambda
 resource "aws_iam_role" "lambda_role" {
     name = "scrapper_lambda_role"
@@ -28,10 +31,12 @@ resource "aws_lambda_function" "test_lambda" {
   filename     = data.archive_file.origin_request_lambda_source.output_path  # Path to the Lambda deployment package
   timeout      = 600  # Maximum execution time for the Lambda function (in seconds)
   memory_size  = 2048  # Memory allocated to the Lambda function (in MB)
-  layers = ["arn:aws:lambda:us-east-1:770693421928:layer:Klayers-p311-pandas:5", "arn:aws:lambda:us-east-1:770693421928:layer:Klayers-p311-beautifulsoup4:2", "arn:aws:lambda:us-east-1:770693421928:layer:Klayers-p311-requests:4", "arn:aws:lambda:us-east-1:693071886825:layer:tqdm:1"]
+  # AWS SDK for pandas (AWS managed) provides pandas, numpy and pyarrow for the parquet output format
+  layers = ["arn:aws:lambda:us-east-1:336392948345:layer:AWSSDKPandas-Python311:12", "arn:aws:lambda:us-east-1:770693421928:layer:Klayers-p311-beautifulsoup4:2", "arn:aws:lambda:us-east-1:770693421928:layer:Klayers-p311-requests:4", var.schema_layer_arn]
   environment {
     variables = {
       BUCKET_NAME = "enroute-project"  # Environment variables for the Lambda function
+      METRICS_SINK = "emf"  # run metrics as CloudWatch EMF log records, "off" disables them
     }
   }
 }
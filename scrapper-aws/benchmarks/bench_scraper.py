@@ -0,0 +1,221 @@
+"""
+NikeScrAPI throughput benchmark against the replayed Nike endpoints (see replay.py), no network needed.
+Runs getData for every max_pages / get_description combination, each case in a fresh process so its
+peak RSS is its own, and reports requests/s, rows/s, peak RSS and the time spent per stage.
+
+    python scrapper-aws/benchmarks/bench_scraper.py
+    python scrapper-aws/benchmarks/bench_scraper.py --max-pages 1 10 --latency 0.02 --jitter 0.5 --workers 8
+    python scrapper-aws/benchmarks/bench_scraper.py --corpus /path/to/recorded --output results.json
+    python scrapper-aws/benchmarks/bench_scraper.py --baseline results.json --tolerance 0.1
+
+With --baseline the run exits with status 1 when a case lost more than tolerance of its requests/s or rows/s
+"""
+import argparse
+import contextlib
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'lambda-files'))
+sys.path.insert(0, os.path.join(HERE, '..', '..', 'schema-layer', 'layer-files', 'python'))
+os.environ.setdefault('BUCKET_NAME', 'benchmark')
+
+from replay import ReplayAdapter, RecordedCorpus, SyntheticCorpus  # noqa: E402
+
+# categories crawled by NikeScrAPI when no single category is given
+CATEGORIES = [
+    'cycling', 'jordan', 'running', 'golf', 'training', 'tennis', 'football',
+    'basketball', 'boot', 'baseball', 'soccer', 'hiit', 'volleyball', 'lifestyle',
+]
+
+
+def open_corpus(config: dict):
+    if config['corpus']:
+        return RecordedCorpus(config['corpus'])
+    return SyntheticCorpus.spread(CATEGORIES, largest=config['largest'], seed=config['seed'])
+
+
+def current_rss_mb():
+    with open('/proc/self/statm') as file:
+        return int(file.read().split()[1]) * resource.getpagesize() / 2 ** 20
+
+
+def run_case(config: dict):
+    """
+    runs one getData in this process and returns its measurements
+    """
+    from http_client import HttpClient
+    from nikescrapi import NikeScrAPI
+    from nike_metrics import Metrics, MemorySink
+
+    adapter = ReplayAdapter(
+        open_corpus(config),
+        latency=config['latency'],
+        jitter=config['jitter'],
+        error_rate=config['error_rate'],
+        drop_rate=config['drop_rate'],
+        seed=config['seed'],
+    )
+    client = HttpClient(backoff=config['backoff'], max_per_host=config['max_per_host'])
+    client.session.mount('https://', adapter)
+    client.session.mount('http://', adapter)
+    metrics = Metrics(dimensions={'Function': 'benchmark'}, sink=MemorySink())
+    rss_before = current_rss_mb()
+
+    with tempfile.TemporaryDirectory() as folder:
+        start = time.perf_counter()
+        scraper = NikeScrAPI(
+            max_pages=config['max_pages'],
+            get_description=config['get_description'],
+            path=os.path.join(folder, 'data'),
+            output_location=os.path.join(folder, 'lake'),
+            output_format=config['output_format'],
+            workers=config['workers'],
+            max_per_host=config['max_per_host'],
+            client=client,
+            metrics=metrics,
+        )
+        setup_seconds = time.perf_counter() - start
+
+        # scraper progress output is dropped unless verbose, printing is not what is measured
+        with open(os.devnull, 'w') as devnull, contextlib.ExitStack() as quiet:
+            if not config['verbose']:
+                quiet.enter_context(contextlib.redirect_stdout(devnull))
+                quiet.enter_context(contextlib.redirect_stderr(devnull))
+            start = time.perf_counter()
+            shoes = scraper.getData()
+            seconds = time.perf_counter() - start
+        record = metrics.flush()
+
+    requests_served = sum(adapter.requests.values())
+    return {
+        'case': case_name(config),
+        'max_pages': config['max_pages'],
+        'get_description': config['get_description'],
+        'seconds': round(seconds, 3),
+        'requests': requests_served,
+        'rows': len(shoes),
+        'requests_per_second': round(requests_served / seconds, 1),
+        'rows_per_second': round(len(shoes) / seconds, 1),
+        'rss_before_mb': round(rss_before, 1),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'bytes_served': adapter.bytes,
+        'bytes_written': record['ProductBytesWritten'],
+        'dedup_ratio': record['DedupRatio'],
+        'errors_served': adapter.errors + adapter.dropped,
+        # getData stages from the scraper metrics, request seconds are summed over threads
+        # and overlap with each other when workers > 1
+        'stages': {
+            'setup': round(setup_seconds, 3),
+            'get_data': round(seconds, 3),
+            **{
+                name[:-len('Seconds')]: round(value, 3)
+                for name, value in record.items() if name.endswith('Seconds')
+            },
+            'browse_requests': round(adapter.seconds['browse'], 3),
+            'page_requests': round(adapter.seconds['page'], 3),
+        },
+        'http': dict(record['HttpHosts'], latency_ms={
+            label: record[f'HttpLatency{label}'] for label in ('P50', 'P95', 'P99')
+        }),
+    }
+
+
+def case_name(config: dict):
+    return f"max_pages={config['max_pages']} get_description={config['get_description']}"
+
+
+def run_benchmarks(config: dict, max_pages: list, descriptions: list):
+    """
+    runs every case in its own spawned process, returns the list of results
+    """
+    results = []
+    for get_description in descriptions:
+        for pages in max_pages:
+            case = dict(config, max_pages=pages, get_description=get_description)
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as pool:
+                result = pool.submit(run_case, case).result()
+            print(
+                f"{result['case']:<40} {result['seconds']:>9.2f}s {result['requests_per_second']:>9.1f} req/s "
+                f"{result['rows_per_second']:>10.1f} rows/s {result['peak_rss_mb']:>8.1f} MB peak"
+            )
+            results.append(result)
+    return results
+
+
+def regressions(results: list, baseline: list, tolerance: float):
+    """
+    messages for the cases whose requests/s or rows/s fell more than tolerance below the baseline
+    """
+    previous = {result['case']: result for result in baseline}
+    messages = []
+    for result in results:
+        before = previous.get(result['case'])
+        if before is None:
+            continue
+        for metric in ('requests_per_second', 'rows_per_second'):
+            if before[metric] and result[metric] < before[metric] * (1 - tolerance):
+                messages.append(f"{result['case']}: {metric} {before[metric]} -> {result[metric]}")
+    return messages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark NikeScrAPI against replayed Nike endpoints")
+    parser.add_argument('--max-pages', type=int, nargs='+', default=[1, 10, 50, 200], help="max_pages of each case")
+    parser.add_argument('--descriptions', choices=['on', 'off', 'both'], default='both', help="get_description cases")
+    parser.add_argument('--corpus', help="recorded corpus folder (synthetic corpus by default)")
+    parser.add_argument('--largest', type=int, default=12000, help="products of the largest synthetic category")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument('--jitter', type=float, default=0.0, help="+/- share of latency drawn per request")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="share of requests answered with a 503")
+    parser.add_argument('--drop-rate', type=float, default=0.0, help="share of requests failing to connect")
+    parser.add_argument('--backoff', type=float, default=0.05, help="HttpClient retry backoff base seconds")
+    parser.add_argument('--workers', type=int, default=1, help="NikeScrAPI workers")
+    parser.add_argument('--max-per-host', type=int, default=4, help="NikeScrAPI max_per_host")
+    parser.add_argument('--output-format', default='csv', choices=['csv', 'parquet'])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--verbose', action='store_true', help="keeps the scraper output")
+    parser.add_argument('--output', help="writes the results as JSON")
+    parser.add_argument('--baseline', help="results JSON of a previous run to compare with")
+    parser.add_argument('--tolerance', type=float, default=0.1, help="allowed throughput loss against the baseline")
+    args = parser.parse_args()
+
+    config = {
+        'corpus': args.corpus,
+        'largest': args.largest,
+        'latency': args.latency,
+        'jitter': args.jitter,
+        'error_rate': args.error_rate,
+        'drop_rate': args.drop_rate,
+        'backoff': args.backoff,
+        'workers': args.workers,
+        'max_per_host': args.max_per_host,
+        'output_format': args.output_format,
+        'seed': args.seed,
+        'verbose': args.verbose,
+    }
+    descriptions = {'on': [True], 'off': [False], 'both': [False, True]}[args.descriptions]
+    results = run_benchmarks(config, args.max_pages, descriptions)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({'config': config, 'results': results}, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)['results']
+        messages = regressions(results, baseline, args.tolerance)
+        for message in messages:
+            print(f"REGRESSION {message}")
+        if messages:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
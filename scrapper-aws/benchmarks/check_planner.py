@@ -0,0 +1,92 @@
+"""
+Checks the browse requests NikeScrAPI plans against the replayed Nike endpoints (see replay.py), no network needed.
+Every category of a synthetic corpus is crawled serially and concurrently, and the browse requests served must be
+the pages the category holds: ceil(products / page_size) when responses report their totals, one more request
+for categories filling their last page when the pages block is missing (pages are followed while they come back full).
+
+    python scrapper-aws/benchmarks/check_planner.py
+    python scrapper-aws/benchmarks/check_planner.py --max-pages 5 --workers 1 4
+
+Exits with status 1 when a crawl sent another number of browse requests
+"""
+import argparse
+import contextlib
+import math
+import os
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'lambda-files'))
+sys.path.insert(0, os.path.join(HERE, '..', '..', 'schema-layer', 'layer-files', 'python'))
+os.environ.setdefault('BUCKET_NAME', 'benchmark')
+
+from replay import ReplayAdapter, SyntheticCorpus  # noqa: E402
+
+PAGE_SIZE = 60
+
+# empty, partial page, exactly full pages, a bit over full pages, many pages
+SIZES = {'cycling': 0, 'jordan': 25, 'running': 120, 'golf': 121, 'training': 1000}
+
+
+def expected_requests(size: int, max_pages: int, pages: bool):
+    """
+    browse requests needed to walk a category of size products
+    """
+    if pages:
+        return min(max_pages, max(1, math.ceil(size / PAGE_SIZE)))
+    return min(max_pages, size // PAGE_SIZE + 1)
+
+
+def crawl(category: str, corpus, max_pages: int, workers: int, pages: bool):
+    """
+    browse requests served for a crawl of category
+    """
+    from http_client import HttpClient
+    from nikescrapi import NikeScrAPI
+
+    adapter = ReplayAdapter(corpus, pages=pages)
+    client = HttpClient()
+    client.session.mount('https://', adapter)
+    client.session.mount('http://', adapter)
+    with tempfile.TemporaryDirectory() as folder, open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        NikeScrAPI(
+            max_pages=max_pages,
+            single_category=category,
+            get_description=False,
+            page_size=PAGE_SIZE,
+            path=os.path.join(folder, 'data'),
+            output_location=os.path.join(folder, 'lake'),
+            workers=workers,
+            client=client,
+        ).getData()
+    return adapter.requests['browse']
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the browse requests planned by NikeScrAPI")
+    parser.add_argument('--max-pages', type=int, nargs='+', default=[1, 3, 200], help="max_pages of each case")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4], help="NikeScrAPI workers of each case")
+    args = parser.parse_args()
+
+    corpus = SyntheticCorpus(SIZES)
+    failures = 0
+    for pages in (True, False):
+        for max_pages in args.max_pages:
+            for workers in args.workers:
+                for category, size in SIZES.items():
+                    served = crawl(category, corpus, max_pages, workers, pages)
+                    expected = expected_requests(size, max_pages, pages)
+                    status = 'ok' if served == expected else 'FAILED'
+                    failures += served != expected
+                    print(
+                        f"pages={pages!s:<5} max_pages={max_pages:<4} workers={workers:<3} {category:<10} "
+                        f"{size:>5} products {served:>4} requests (expected {expected}) {status}"
+                    )
+    if failures:
+        print(f"{failures} crawls sent another number of browse requests")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
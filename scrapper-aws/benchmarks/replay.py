@@ -0,0 +1,313 @@
+"""
+Offline stand-in for the Nike endpoints used by NikeScrAPI:
+
+    https://api.nike.com/cic/browse/v2?...searchTerms=<category>&anchor=<n>&count=<n>...   browse JSON pages
+    https://www.nike.com/t/<product>                                                        product HTML pages
+
+ReplayAdapter is a requests transport adapter, mounted on the session of an HttpClient it answers from a
+corpus instead of the network, so retries, rate limiting and connection slots of the client still run.
+Corpora are either synthetic (generated per request, nothing held in memory) or recorded from the real
+site with RecordingAdapter:
+
+    corpus/browse/<category>.jsonl   one browse API product per line, in page order
+    corpus/pages/<product>.html      product pages
+"""
+import json
+import os
+import random
+import re
+import time
+from http import HTTPStatus
+from io import BytesIO
+from threading import Lock
+from urllib.parse import unquote, urlparse
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+BROWSE_HOST = 'api.nike.com'
+PAGE_HOST = 'www.nike.com'
+
+COLORS = ['Black/White', 'White/University Red', 'Photon Dust', 'Game Royal', 'Volt/Black', 'Light Bone']
+LABELS = ['IN_STOCK', 'JUST_IN', 'SOLD_OUT', 'BEST_SELLER']
+
+
+def browse_query(url: str):
+    """
+    returns (category, anchor, count) of a browse API url, the query is nested and percent encoded
+    """
+    endpoint = unquote(unquote(url))
+    category = re.search(r'searchTerms=([^&]+)', endpoint).group(1)
+    anchor = int(re.search(r'anchor=(\d+)', endpoint).group(1))
+    count = int(re.search(r'count=(\d+)', endpoint).group(1))
+    return category, anchor, count
+
+
+def browse_page(products: list, anchor: int, count: int, total: int):
+    """
+    body of a browse API response, same layout as the real one
+    """
+    following = anchor + count
+    pages = {
+        'prev': f'/product_feed/rollup_threads/v2?anchor={max(0, anchor - count)}&count={count}' if anchor else '',
+        'next': f'/product_feed/rollup_threads/v2?anchor={following}&count={count}' if following < total else '',
+        'totalPages': -(-total // count),
+        'totalResources': total,
+    }
+    return {'data': {'products': {'products': products, 'pages': pages}}}
+
+
+def product_slug(url: str):
+    return urlparse(url).path.rstrip('/').rsplit('/', 1)[-1]
+
+
+class SyntheticCorpus():
+    """
+    Deterministic catalog shaped like the browse API, products are built when requested.
+    sizes: {category: number of products}
+    colorways: maximum colorways per product (1 to colorways)
+    footwear_share: share of products with productType FOOTWEAR, the rest are skipped by the scraper
+    """
+    def __init__(self, sizes: dict, colorways=4, footwear_share=0.8, seed=0):
+        self.sizes = dict(sizes)
+        self.__colorways = colorways
+        self.__footwear_share = footwear_share
+        self.__seed = seed
+
+    @classmethod
+    def spread(cls, categories: list, smallest=40, largest=12000, **kwargs):
+        """
+        corpus whose category sizes grow geometrically from smallest to largest products,
+        so every max_pages setting up to largest / 60 pages changes the crawl
+        """
+        steps = max(1, len(categories) - 1)
+        sizes = {
+            category: int(round(smallest * (largest / smallest) ** (n / steps)))
+            for n, category in enumerate(categories)
+        }
+        return cls(sizes, **kwargs)
+
+    def size(self, category: str):
+        return self.sizes.get(category, 0)
+
+    def __random(self, category, index):
+        return random.Random(f'{self.__seed}:{category}:{index}')
+
+    def __product(self, category, index):
+        rng = self.__random(category, index)
+        product_id = f'{category[:4]}{index:06d}-{rng.getrandbits(48):012x}'
+        full_price = float(rng.choice([60, 75, 90, 110, 120, 140, 160, 180, 200]))
+        discounted = rng.random() < 0.3
+        current_price = round(full_price * (0.75 if discounted else 1.0), 2)
+        colorways = []
+        for k in range(rng.randint(1, self.__colorways)):
+            colorways.append({
+                'cloudProductId': f'{rng.getrandbits(64):016x}',
+                'colorDescription': rng.choice(COLORS),
+                'price': {'fullPrice': full_price, 'currentPrice': current_price, 'discounted': discounted},
+                'isBestSeller': rng.random() < 0.1,
+                'inStock': rng.random() < 0.9,
+                'isMemberExclusive': rng.random() < 0.05,
+                'isNew': rng.random() < 0.2,
+                'label': rng.choice(LABELS),
+                'images': {'portraitURL': f'https://static.nike.com/a/images/{product_id}-{k}.png'},
+            })
+        return {
+            'cloudProductId': f'{rng.getrandbits(64):016x}',
+            'id': product_id,
+            'productType': 'FOOTWEAR' if rng.random() < self.__footwear_share else 'APPAREL',
+            'title': f'Nike {category.title()} {index % 97}',
+            'subtitle': rng.choice(["Men's Shoes", "Women's Shoes", "Big Kids' Shoes", 'Road Running Shoes']),
+            'price': {'currency': 'USD', 'fullPrice': full_price, 'currentPrice': current_price, 'discounted': discounted},
+            'colorDescription': colorways[0]['colorDescription'],
+            'salesChannel': ['NikeApp', 'Nike.com'],
+            'url': '{countryLang}/t/' + product_id,
+            'customizable': rng.random() < 0.05,
+            'hasExtendedSizing': rng.random() < 0.2,
+            'inStock': rng.random() < 0.9,
+            'isComingSoon': False,
+            'isBestSeller': rng.random() < 0.1,
+            'isExcluded': False,
+            'isGiftCard': False,
+            'isJersey': False,
+            'isLaunch': rng.random() < 0.05,
+            'isMemberExclusive': rng.random() < 0.05,
+            'isNBA': False,
+            'isNFL': False,
+            'isSustainable': rng.random() < 0.15,
+            'label': rng.choice(LABELS),
+            'prebuildId': None,
+            'colorways': colorways,
+        }
+
+    def products(self, category: str, start: int, stop: int):
+        return [self.__product(category, index) for index in range(start, min(stop, self.size(category)))]
+
+    def page(self, slug: str):
+        """
+        product page html, None for unknown products
+        """
+        if not slug:
+            return None
+        rng = random.Random(f'{self.__seed}:{slug}')
+        return (
+            '<html><body><div class="product-info">'
+            f'<div class="description-preview"><p>{slug} {" ".join(rng.choice(COLORS) for _ in range(12))}</p></div>'
+            f'<p class="d-sm-ib pl4-sm">{rng.uniform(3, 5):.1f} Stars</p>'
+            '</div></body></html>'
+        )
+
+
+class RecordedCorpus():
+    """
+    Corpus captured from the real endpoints by RecordingAdapter, see the module docstring for the layout
+    """
+    def __init__(self, folder: str):
+        self.__folder = folder
+        self.__products = {}
+        browse = os.path.join(folder, 'browse')
+        for file_name in sorted(os.listdir(browse)):
+            if file_name.endswith('.jsonl'):
+                with open(os.path.join(browse, file_name), encoding='utf-8') as file:
+                    self.__products[file_name[:-len('.jsonl')]] = [json.loads(line) for line in file if line.strip()]
+        self.sizes = {category: len(products) for category, products in self.__products.items()}
+
+    def size(self, category: str):
+        return self.sizes.get(category, 0)
+
+    def products(self, category: str, start: int, stop: int):
+        return self.__products.get(category, [])[start:stop]
+
+    def page(self, slug: str):
+        path = os.path.join(self.__folder, 'pages', f'{slug}.html')
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding='utf-8') as file:
+            return file.read()
+
+
+class ReplayAdapter(BaseAdapter):
+    """
+    requests transport adapter serving a corpus.
+    latency: seconds added to every response, jitter: +/- share of latency drawn per request
+    error_rate: share of requests answered with a 503 (retried by HttpClient)
+    drop_rate: share of requests failing with a connection error
+    pages: include the pages block (totals and next link) in browse responses
+    """
+    def __init__(self, corpus, latency=0.0, jitter=0.0, error_rate=0.0, drop_rate=0.0, seed=0, pages=True):
+        super().__init__()
+        self.corpus = corpus
+        self.__pages = pages
+        self.__latency = latency
+        self.__jitter = jitter
+        self.__error_rate = error_rate
+        self.__drop_rate = drop_rate
+        self.__random = random.Random(seed)
+        self.__lock = Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        clears the counters: {kind: requests}, {kind: seconds}, errors, dropped and bytes served
+        """
+        with self.__lock:
+            self.requests = {'browse': 0, 'page': 0}
+            self.seconds = {'browse': 0.0, 'page': 0.0}
+            self.errors = 0
+            self.dropped = 0
+            self.bytes = 0
+
+    def __draw(self):
+        with self.__lock:
+            delay = self.__latency * (1 + self.__jitter * (2 * self.__random.random() - 1))
+            outcome = self.__random.random()
+        if outcome < self.__drop_rate:
+            return delay, 'drop'
+        if outcome < self.__drop_rate + self.__error_rate:
+            return delay, 'error'
+        return delay, 'ok'
+
+    def __body(self, url):
+        host = urlparse(url).netloc
+        if host == BROWSE_HOST:
+            category, anchor, count = browse_query(url)
+            total = self.corpus.size(category)
+            products = self.corpus.products(category, anchor, anchor + count)
+            body = browse_page(products, anchor, count, total)
+            if not self.__pages:
+                del body['data']['products']['pages']
+            return 'browse', 200, json.dumps(body), 'application/json'
+        if host == PAGE_HOST:
+            html = self.corpus.page(product_slug(url))
+            return 'page', 200 if html is not None else 404, html or '', 'text/html; charset=utf-8'
+        return 'page', 404, '', 'text/plain'
+
+    def __response(self, request, status, body, content_type):
+        response = requests.Response()
+        response.status_code = status
+        response.reason = HTTPStatus(status).phrase
+        response.headers = CaseInsensitiveDict({'Content-Type': content_type, 'Content-Length': str(len(body))})
+        response.raw = BytesIO(body)
+        response._content = body
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        return response
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        start = time.perf_counter()
+        delay, outcome = self.__draw()
+        kind, status, body, content_type = self.__body(request.url)
+        if delay > 0:
+            time.sleep(delay)
+        body = body.encode('utf-8')
+
+        with self.__lock:
+            self.requests[kind] += 1
+            self.seconds[kind] += time.perf_counter() - start
+            if outcome == 'drop':
+                self.dropped += 1
+            elif outcome == 'error':
+                self.errors += 1
+            else:
+                self.bytes += len(body)
+
+        if outcome == 'drop':
+            raise requests.ConnectionError(f'replayed connection error for {request.url}', request=request)
+        if outcome == 'error':
+            return self.__response(request, 503, b'', 'text/plain')
+        return self.__response(request, status, body, content_type)
+
+    def close(self):
+        pass
+
+
+class RecordingAdapter(HTTPAdapter):
+    """
+    HTTP adapter saving the browse products and product pages it downloads into a corpus folder,
+    mount it on the session of the HttpClient of a live NikeScrAPI run (single worker keeps page order)
+    """
+    def __init__(self, folder: str, **kwargs):
+        super().__init__(**kwargs)
+        self.__folder = folder
+        self.__lock = Lock()
+        os.makedirs(os.path.join(folder, 'browse'), exist_ok=True)
+        os.makedirs(os.path.join(folder, 'pages'), exist_ok=True)
+
+    def send(self, request, **kwargs):
+        response = super().send(request, **kwargs)
+        if response.status_code != 200:
+            return response
+
+        host = urlparse(request.url).netloc
+        with self.__lock:
+            if host == BROWSE_HOST:
+                category, _, _ = browse_query(request.url)
+                products = ((response.json().get('data') or {}).get('products') or {}).get('products') or []
+                with open(os.path.join(self.__folder, 'browse', f'{category}.jsonl'), 'a', encoding='utf-8') as file:
+                    file.writelines(json.dumps(product) + '\n' for product in products)
+            elif host == PAGE_HOST:
+                with open(os.path.join(self.__folder, 'pages', f'{product_slug(request.url)}.html'), 'w', encoding='utf-8') as file:
+                    file.write(response.text)
+        return response
@@ -0,0 +1,34 @@
+import json
+import time
+
+
+class Checkpoint():
+    """
+    Scraper progress persisted in a store (LocalStore or S3Store), so a later invocation can resume
+    max_age: seconds after which a saved checkpoint is ignored and the crawl starts over
+    """
+    __key = 'checkpoint.json'
+
+    def __init__(self, store, max_age=24 * 3600):
+        self.__store = store
+        self.__max_age = max_age
+
+    def load(self):
+        """
+        returns the saved state or None when there is none or it expired
+        """
+        body = self.__store.get(self.__key)
+        if body is None:
+            return None
+        state = json.loads(body)
+        if time.time() - state['saved'] > self.__max_age:
+            print(f"Ignoring checkpoint saved at {time.ctime(state['saved'])}")
+            return None
+        return state
+
+    def save(self, **state):
+        state['saved'] = time.time()
+        self.__store.put(self.__key, json.dumps(state).encode('utf-8'))
+
+    def clear(self):
+        self.__store.delete(self.__key)
@@ -0,0 +1,148 @@
+import gzip
+import hashlib
+import json
+import time
+from threading import Lock
+
+
+class CachedResponse():
+    """
+    Minimal response object served from the cache
+    """
+    from_cache = True
+
+    def __init__(self, url: str, content: bytes, headers: dict, status_code=200):
+        self.url = url
+        self.content = content
+        self.headers = headers
+        self.status_code = status_code
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class ResponseCache():
+    """
+    Persistent HTTP response cache keyed by URL
+    store: LocalStore or S3Store holding the index and the gzipped bodies
+    ttl: seconds an entry is served without revalidation
+    max_bytes: size bound of the stored bodies, least recently used entries are evicted first
+    """
+    __index_key = 'index.json'
+
+    def __init__(self, store, ttl=7 * 24 * 3600, max_bytes=512 * 1024 * 1024):
+        self.__store = store
+        self.__ttl = ttl
+        self.__max_bytes = max_bytes
+        self.__lock = Lock()
+        self.__dirty = False
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+
+        index = store.get(self.__index_key)
+        self.__index = json.loads(index) if index else {}
+
+    @staticmethod
+    def __objectKey(url: str):
+        return 'objects/' + hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+    def lookup(self, url: str, ttl=None):
+        """
+        returns (response, fresh) for a cached url or (None, False) on a miss.
+        Stale entries must be revalidated with conditional_headers() before use
+        """
+        with self.__lock:
+            entry = self.__index.get(url)
+            if entry is None:
+                self.misses += 1
+                return None, False
+
+        body = self.__store.get(entry['key'])
+        if body is None:
+            with self.__lock:
+                self.__index.pop(url, None)
+                self.__dirty = True
+                self.misses += 1
+            return None, False
+
+        ttl = self.__ttl if ttl is None else ttl
+        fresh = time.time() - entry['stored'] < ttl
+        with self.__lock:
+            entry['accessed'] = time.time()
+            self.__dirty = True
+            if fresh:
+                self.hits += 1
+        return CachedResponse(url, gzip.decompress(body), entry['headers']), fresh
+
+    def conditional_headers(self, url: str):
+        """
+        If-None-Match / If-Modified-Since headers to revalidate a stale entry
+        """
+        with self.__lock:
+            entry = self.__index.get(url, {})
+        headers = {}
+        if entry.get('headers', {}).get('ETag'):
+            headers['If-None-Match'] = entry['headers']['ETag']
+        if entry.get('headers', {}).get('Last-Modified'):
+            headers['If-Modified-Since'] = entry['headers']['Last-Modified']
+        return headers
+
+    def refresh(self, url: str):
+        """
+        marks an entry as fresh again after a 304 Not Modified
+        """
+        with self.__lock:
+            if url in self.__index:
+                self.__index[url]['stored'] = time.time()
+                self.__dirty = True
+            self.revalidated += 1
+
+    def save(self, url: str, response):
+        """
+        stores a 200 response body with its validators
+        """
+        if response.status_code != 200:
+            return
+        body = gzip.compress(response.content)
+        key = self.__objectKey(url)
+        self.__store.put(key, body)
+
+        headers = {name: response.headers[name] for name in ('ETag', 'Last-Modified', 'Content-Type') if name in response.headers}
+        now = time.time()
+        with self.__lock:
+            self.__index[url] = {'key': key, 'size': len(body), 'stored': now, 'accessed': now, 'headers': headers}
+            self.__dirty = True
+
+    def __evict(self):
+        """
+        drops least recently used entries until the cache fits in max_bytes
+        """
+        total = sum(entry['size'] for entry in self.__index.values())
+        if total <= self.__max_bytes:
+            return
+        for url, entry in sorted(self.__index.items(), key=lambda item: item[1]['accessed']):
+            self.__store.delete(entry['key'])
+            del self.__index[url]
+            total -= entry['size']
+            if total <= self.__max_bytes:
+                break
+
+    def flush(self):
+        """
+        applies the size bound and persists the index
+        """
+        with self.__lock:
+            if not self.__dirty:
+                return
+            self.__evict()
+            self.__store.put(self.__index_key, json.dumps(self.__index).encode('utf-8'))
+            self.__dirty = False
+
+    def stats(self):
+        with self.__lock:
+            return {'hits': self.hits, 'revalidated': self.revalidated, 'misses': self.misses, 'entries': len(self.__index)}
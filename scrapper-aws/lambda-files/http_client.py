@@ -0,0 +1,203 @@
+import random
+import time
+from threading import BoundedSemaphore, Lock
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class TokenBucket():
+    """
+    Thread safe token bucket rate limiter
+    rate: tokens added per second
+    capacity: maximum burst of requests (defaults to rate)
+    """
+    def __init__(self, rate: float, capacity: float = None):
+        self.__rate = rate
+        self.__capacity = capacity or max(1.0, rate)
+        self.__tokens = self.__capacity
+        self.__updated = time.monotonic()
+        self.__lock = Lock()
+
+    def acquire(self):
+        """
+        blocks until a token is available and takes it
+        """
+        while True:
+            with self.__lock:
+                now = time.monotonic()
+                self.__tokens = min(self.__capacity, self.__tokens + (now - self.__updated) * self.__rate)
+                self.__updated = now
+                if self.__tokens >= 1:
+                    self.__tokens -= 1
+                    return
+                wait = (1 - self.__tokens) / self.__rate
+            time.sleep(wait)
+
+
+class LatencyStats():
+    """
+    Per host request counters and latencies, one sample per attempt
+    """
+    def __init__(self):
+        self.__samples = {}
+        self.__counters = {}
+        self.__lock = Lock()
+
+    def record(self, host: str, seconds: float, status=None, retried=False):
+        with self.__lock:
+            self.__samples.setdefault(host, []).append(seconds)
+            counters = self.__counters.setdefault(host, {'requests': 0, 'retries': 0, 'errors': 0})
+            counters['requests'] += 1
+            if retried:
+                counters['retries'] += 1
+            if status is None or status >= 400:
+                counters['errors'] += 1
+
+    def latencies(self):
+        """
+        returns the latency of every attempt, all hosts together
+        """
+        with self.__lock:
+            return [seconds for samples in self.__samples.values() for seconds in samples]
+
+    def summary(self):
+        """
+        returns {host: {requests, retries, errors, mean, p50, p95, max}} with latencies in seconds
+        """
+        with self.__lock:
+            summary = {}
+            for host, samples in self.__samples.items():
+                ordered = sorted(samples)
+                summary[host] = dict(
+                    self.__counters[host],
+                    mean=round(sum(ordered) / len(ordered), 4),
+                    p50=round(ordered[int(0.50 * (len(ordered) - 1))], 4),
+                    p95=round(ordered[int(0.95 * (len(ordered) - 1))], 4),
+                    max=round(ordered[-1], 4),
+                )
+            return summary
+
+
+class HttpClient():
+    """
+    Reusable HTTP client for the scraper
+    timeout: requests timeout (connect, read)
+    max_retries: attempts after the first one for connection errors, 429 and 5xx responses
+    backoff: base seconds for the exponential backoff (full jitter)
+    max_backoff: upper bound of a single backoff sleep
+    rate: requests per second allowed across all hosts (None for no limit)
+    max_per_host: simultaneous requests and keep-alive connections per host
+    cache: optional ResponseCache used by get()
+    """
+    RETRY_STATUS = (429, 500, 502, 503, 504)
+
+    def __init__(self,
+                 timeout=(5, 15),
+                 max_retries=4,
+                 backoff=0.5,
+                 max_backoff=30,
+                 rate=None,
+                 max_per_host=4,
+                 headers=None,
+                 cache=None):
+        self.__timeout = timeout
+        self.__max_retries = max_retries
+        self.__backoff = backoff
+        self.__max_backoff = max_backoff
+        self.__max_per_host = max_per_host
+        self.__bucket = TokenBucket(rate) if rate else None
+        self.__host_slots = {}
+        self.__host_slots_lock = Lock()
+        self.stats = LatencyStats()
+        self.cache = cache
+
+        # one pool of keep-alive connections per host, shared by every thread
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=max_per_host)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        if headers:
+            self.session.headers.update(headers)
+
+    def __hostSlot(self, host):
+        """
+        returns the semaphore limiting concurrent requests to a host
+        """
+        with self.__host_slots_lock:
+            if host not in self.__host_slots:
+                self.__host_slots[host] = BoundedSemaphore(self.__max_per_host)
+            return self.__host_slots[host]
+
+    def __sleepTime(self, attempt, response):
+        """
+        seconds to wait before the next attempt, honoring Retry-After when present
+        """
+        if response is not None:
+            retry_after = response.headers.get('Retry-After')
+            if retry_after and retry_after.isdigit():
+                return min(self.__max_backoff, int(retry_after))
+        return random.uniform(0, min(self.__max_backoff, self.__backoff * 2 ** attempt))
+
+    def request(self, verb: str, url: str, **kwargs):
+        """
+        sends a request, retrying connection errors, 429 and 5xx responses.
+        Raises the last exception (or requests.HTTPError) once retries are exhausted
+        """
+        kwargs.setdefault('timeout', self.__timeout)
+        host = urlparse(url).netloc
+
+        for attempt in range(self.__max_retries + 1):
+            if self.__bucket:
+                self.__bucket.acquire()
+
+            response = None
+            start = time.perf_counter()
+            try:
+                with self.__hostSlot(host):
+                    response = self.session.request(verb, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                self.stats.record(host, time.perf_counter() - start, retried=attempt > 0)
+                if attempt == self.__max_retries:
+                    raise
+            else:
+                self.stats.record(host, time.perf_counter() - start, response.status_code, retried=attempt > 0)
+                if response.status_code not in self.RETRY_STATUS:
+                    response.raise_for_status()
+                    return response
+                if attempt == self.__max_retries:
+                    response.raise_for_status()
+
+            time.sleep(self.__sleepTime(attempt, response))
+
+    def get(self, url: str, cache_ttl=None, **kwargs):
+        """
+        GET request served from the response cache when one is configured.
+        Stale entries are revalidated with ETag / Last-Modified, cache_ttl overrides the cache ttl for this url
+        """
+        if self.cache is None:
+            return self.request('get', url, **kwargs)
+
+        cached, fresh = self.cache.lookup(url, ttl=cache_ttl)
+        if fresh:
+            return cached
+        if cached is not None:
+            kwargs['headers'] = dict(kwargs.get('headers') or {}, **self.cache.conditional_headers(url))
+
+        response = self.request('get', url, **kwargs)
+        if response.status_code == 304 and cached is not None:
+            self.cache.refresh(url)
+            return cached
+
+        # the response is good even if it can not be cached
+        try:
+            self.cache.save(url, response)
+        except Exception as e:
+            print(f"HTTP cache write failed for {url}: {e}")
+        return response
+
+    def close(self):
+        if self.cache is not None:
+            self.cache.flush()
+        self.session.close()
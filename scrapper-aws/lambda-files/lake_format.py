@@ -0,0 +1,76 @@
+import pandas as pd
+
+# shared column schema (schema Lambda layer), PRODUCT_FIELDS and SALES_FIELDS are re-exported
+from nike_schema import PRODUCT_FIELDS, SALES_FIELDS, coerce
+
+# pyarrow is only required for the parquet output format (AWS SDK for pandas Lambda layer)
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+FORMATS = ('csv', 'parquet')
+
+
+def extension(output_format: str):
+    if output_format not in FORMATS:
+        raise ValueError(f"Unknown output format '{output_format}', use one of {FORMATS}")
+    return '.csv' if output_format == 'csv' else '.parquet'
+
+
+def arrow_schema(fields: list):
+    types = {
+        'string': pa.string(), 'category': pa.dictionary(pa.int32(), pa.string()), 'bool': pa.bool_(),
+        'int32': pa.int32(), 'int64': pa.int64(), 'float64': pa.float64(), 'date': pa.date32(),
+    }
+    return pa.schema([(name, types[kind]) for name, kind in fields])
+
+
+def to_arrow(df: pd.DataFrame, fields: list):
+    """
+    coerces the columns of df to the shared schema and returns an arrow table
+    """
+    df = coerce(df, fields)
+    for name, kind in fields:
+        if kind == 'date':
+            df[name] = df[name].dt.date
+    return pa.Table.from_pandas(df, schema=arrow_schema(fields), preserve_index=False)
+
+
+def write_batches(batches, writer, output_format: str, fields: list, compression='snappy'):
+    """
+    writes an iterable of DataFrames into a store writer as CSV, or as parquet with the fixed schema
+    (one row group per batch). Only the batch being encoded is held in memory
+    """
+    if output_format != 'csv' and pa is None:
+        raise ImportError("pyarrow is required for the parquet output format")
+
+    empty = pd.DataFrame(columns=[name for name, _ in fields])
+
+    if output_format == 'csv':
+        header = True
+        for batch in batches:
+            writer.write(batch.to_csv(index=False, header=header).encode('utf-8'))
+            header = False
+        if header:
+            writer.write(empty.to_csv(index=False).encode('utf-8'))
+        return
+
+    sink = pa.PythonFile(writer, mode='w')
+    with pq.ParquetWriter(sink, arrow_schema(fields), compression=compression) as parquet_writer:
+        written = False
+        for batch in batches:
+            parquet_writer.write_table(to_arrow(batch, fields))
+            written = True
+        if not written:
+            parquet_writer.write_table(to_arrow(empty, fields))
+
+
+def write_frame(df: pd.DataFrame, writer, output_format: str, fields: list, compression='snappy', chunk_rows=50000):
+    """
+    writes df into a store writer in chunks of rows
+    """
+    chunks = (df.iloc[start:start + chunk_rows] for start in range(0, len(df), chunk_rows))
+    write_batches(chunks, writer, output_format, fields, compression)
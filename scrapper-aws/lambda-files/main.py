@@ -1,31 +1,86 @@
 import datetime
+import json
+import os
 
 from nikescrapi import NikeScrAPI
 from sales_generator import SalesGenerator
+from storage import open_store
+from nike_metrics import Metrics
+
+# one EMF record per invocation, METRICS_SINK=off disables it
+metrics = Metrics.from_env({'Function': 'scrapper'})
+
+
+def write_manifest(products_target: str, sales_targets: list, output_format: str):
+    """
+    Write the manifest of the objects a run produced next to the data, returns its key
+    """
+    manifest = {
+        'created': datetime.datetime.now().isoformat(),
+        'format': output_format,
+        'products': products_target,
+        'sales': sales_targets,
+    }
+    manifest_target = 'raw/manifests/' + products_target.rsplit('/', 1)[-1].rsplit('.', 1)[0] + '.json'
+    store = open_store(f's3://{os.environ["BUCKET_NAME"]}')
+    store.put(manifest_target, json.dumps(manifest, indent=2).encode('utf-8'))
+    return manifest_target
 
 
 def lambda_handler(event, context):
     print(event)
-    print(f"""#########
-    Loading job with the following parameters:
-    max_pages={event['max_pages']}
-    day_count={event['day_count']}
-    min_sales={event['min_sales']}
-    max_sales={event['max_sales']}
-    #########""")
+    # drops what a failed warm invocation left behind
+    metrics.reset()
     
     # NOTE: for production set max_pages = 200
-    nikeAPI = NikeScrAPI(max_pages=event['max_pages'], path='/tmp/data/products')
-    df = nikeAPI.getData()
+    nikeAPI = NikeScrAPI(
+        max_pages=event['max_pages'],
+        path='/tmp/data/products',
+        workers=event.get('workers', 1),
+        max_per_host=event.get('max_per_host', 4),
+        rate_limit=event.get('rate_limit'),
+        cache=event.get('cache'),
+        tmp_location=event.get('tmp_location'),
+        checkpoint=event.get('checkpoint'),
+        time_margin=event.get('time_margin', 120),
+        output_format=event.get('output_format', 'csv'),
+        compression=event.get('compression', 'snappy'),
+        metrics=metrics
+    )
+    df = nikeAPI.getData(remaining_time=context.get_remaining_time_in_millis)
+
+    # Crawl suspended before the Lambda timeout, next invocation resumes from the checkpoint
+    if not nikeAPI.complete:
+        metrics.property('Status', 'IN_PROGRESS')
+        metrics.flush()
+        return dict(event, status='IN_PROGRESS')
     
     # Sales generator
-    gen = SalesGenerator(nike_df=df, min_sales=event['min_sales'], max_sales=event['max_sales'])
+    gen = SalesGenerator(
+        nike_df=df,
+        min_sales=event['min_sales'],
+        max_sales=event['max_sales'],
+        output_format=event.get('output_format', 'csv'),
+        compression=event.get('compression', 'snappy'),
+        seed=event.get('seed'),
+        workers=event.get('sales_workers', 1),
+        chunk_size=event.get('sales_chunk_size'),
+        use_processes=False,  # Lambda lacks /dev/shm, process pools can not be created
+        metrics=metrics
+    )
     
     end = datetime.datetime.now()
     start = end - datetime.timedelta(days=event['day_count'])
     gen.generate_interval(start=start, end=end)
+
+    manifest_target = write_manifest(nikeAPI.target_object, gen.target_objects, event.get('output_format', 'csv'))
+    metrics.property('Status', 'DONE')
+    metrics.property('Manifest', manifest_target)
+    metrics.flush()
     
     return {
+        'status': 'DONE',
+        'manifest': manifest_target,
         'products_target': nikeAPI.target_object,
         'sales_target': gen.target_object
     }
\ No newline at end of file
@@ -1,24 +1,34 @@
-import requests         
 import json
 import pandas as pd
 import numpy as np
 import os
-import shutil
 
-from tqdm import tqdm
 from bs4 import BeautifulSoup  
 from datetime import datetime
-import boto3
-from io import StringIO
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+from io import BytesIO
+from threading import Event
+
+from http_client import HttpClient
+from http_cache import ResponseCache
+from storage import open_store
+from lake_format import write_frame, extension, PRODUCT_FIELDS
+from row_builder import ShoeRows, SHOE_COLUMNS
+from nike_schema import read_dtypes, coerce
+from nike_metrics import Metrics
+from checkpoint import Checkpoint
+from page_planner import PagePlanner
 
 BUCKET_NAME = os.environ["BUCKET_NAME"]
-s3_resource = boto3.resource('s3')
 
 class NikeScrAPI:   
     '''
     Uses nike's website API to scrape data.
         NOTE: for production set max_pages = 200
     '''
+    MAX_PAGE_SIZE = 60
+
     def __init__(
         self,
         country='US', 
@@ -28,18 +38,58 @@ class NikeScrAPI:
         single_category=None, 
         debug=False, 
         filename='nike',
-        path='data'
+        path='data',
+        page_size=60,
+        workers=1,
+        max_per_host=4,
+        rate_limit=None,
+        cache=None,
+        cache_ttl=7 * 24 * 3600,
+        client=None,
+        tmp_location=None,
+        checkpoint=None,
+        time_margin=120,
+        output_location=None,
+        output_format='csv',
+        compression='snappy',
+        metrics=None
     ):
         
-        self.__count = 3 # 24
-        self.__page_size = 3 # 24
+        # Products per browse API page, 60 is the largest count accepted by the API
+        self.__page_size = min(page_size, self.MAX_PAGE_SIZE)
         self.__country = country
         self.__lan = lan
         self.__DEBUG = debug
         self.__url_base = "https://www.nike.com" 
         self.__DEFAULT_REQUESTS_TIMEOUT = (5, 15) # for example
+        self.__BROWSE_CACHE_TTL = 3600 # browse pages change daily, product pages use cache_ttl
         self.__filePrefix = filename
         self.__path = path
+
+        # Final file destination, the data lake bucket unless another store location is given
+        self.__output_store = open_store(output_location or f's3://{BUCKET_NAME}')
+        # 'csv' or 'parquet' (fixed schema, compression 'snappy' or 'zstd')
+        self.__output_format = output_format
+        self.__compression = compression
+
+        # Intermediate category files, local folder by default or 's3://bucket/prefix'
+        self.__tmp_store = open_store(tmp_location or os.path.join(path, 'tmp'))
+        self.__segments = []
+        self.__seen_uids = set()
+        self.__total_rows = 0
+
+        # Progress saved at every category boundary and before running out of time,
+        # checkpoint is a local folder or 's3://bucket/prefix'. A checkpoint on S3 points to the
+        # intermediate files, so they must outlive the invocation too (tmp_location on S3).
+        # time_margin: seconds left when getData stops to save its progress, only with a checkpoint
+        if checkpoint and checkpoint.startswith('s3://') and not (tmp_location or '').startswith('s3://'):
+            raise ValueError("An S3 checkpoint needs an S3 tmp_location, local intermediate files are lost between invocations")
+        self.__checkpoint = Checkpoint(open_store(checkpoint)) if checkpoint else None
+        self.__time_margin = time_margin
+        self.__remaining_time = None
+        # set when the crawl is suspended, fetches still running in the pool stop at their next request
+        self.__stopping = Event()
+        self.complete = False
         
         # If TRUE, then it gets the full description and ratings from each product's url. 
         # Takes more time, but data is complet
@@ -47,56 +97,30 @@ class NikeScrAPI:
         
         # Estimated max number of pages in each category
         self.__max_number_of_pages = max_pages  # recommended 200 for production, 1 for testing
+
+        # Only the pages reported by the browse API are requested, up to max_pages
+        self.__planner = PagePlanner(self.__page_size, max_pages)
+
+        # Concurrent fetch mode: workers > 1 downloads pages in a thread pool,
+        # max_per_host caps the simultaneous requests against a single host
+        self.__workers = max(1, workers)
+
+        # Pooled HTTP client with retries, rate limiting (requests/s) and latency stats.
+        # cache is a local folder or 's3://bucket/prefix' keeping product and browse pages across runs
+        self.client = client or HttpClient(
+            timeout=self.__DEFAULT_REQUESTS_TIMEOUT,
+            max_per_host=max(1, max_per_host),
+            rate=rate_limit,
+            cache=ResponseCache(open_store(cache), ttl=cache_ttl) if cache else None
+        )
         
-        # Data Structure
-        self.shoeDict = { 
-            'UID':[],
-            'cloudProdID':[],
-            'productID':[],
-            'shortID':[],
-            'colorNum':[],
-            'title':[],
-            'subtitle':[],
-            'category':[],
-            'type':[],
-            'currency':[],
-            'fullPrice':[],
-            'currentPrice':[],
-            'sale':[],
-            'TopColor':[],
-            'channel':[],
-            'short_description':[],
-            'rating':[],
-            
-            'customizable': [],
-            'ExtendedSizing': [],           
-            'inStock': [],
-            'ComingSoon': [],
-            'BestSeller': [],
-            'Excluded': [],
-            'GiftCard': [],
-            'Jersey': [],
-            'Launch': [],
-            'MemberExclusive': [],
-            'NBA': [],
-            'NFL': [],
-            'Sustainable': [],
-            'label': [],
-            'prebuildId': [],
-            'prod_url':[],
-
-            'color-ID':[],
-            'color-Description':[],
-            'color-FullPrice':[],
-            'color-CurrentPrice':[],
-            'color-Discount':[],
-            'color-BestSeller':[],
-            'color-InStock':[],
-            'color-MemberExclusive':[],
-            'color-New':[],
-            'color-Label':[],
-            'color-Image-url':[],
-        } 
+        # Stage timings, page counters, rows in/out and HTTP latencies of the run,
+        # emitted by the caller with metrics.flush(). No-op unless a Metrics with a sink is given
+        self.metrics = metrics or Metrics()
+
+        # Data Structure, one row per product colorway. Holds only the rows of the
+        # category being scraped, previous categories live in the intermediate files
+        self.shoeRows = ShoeRows()
         
         # Nike shoe categories
         if single_category:
@@ -122,11 +146,19 @@ class NikeScrAPI:
     def __repr__(self):
         return f'{type(self).__name__}({self.__max_number_of_pages!r})'   
 
+    @property
+    def shoeDict(self):
+        '''
+        rows of the category being scraped as a dictionary of lists
+        '''
+        return self.shoeRows.to_dict()
+
     def __log_exception(self,e, verb, url, kwargs):
         '''
         log get exceptions (code from https://stackoverflow.com/questions/16511337/correct-way-to-try-except-using-python-requests-module)
         '''
         print(f'exception - Error {e}, {verb}')
+        self.metrics.add('RequestFailures')
         # raw_tb = traceback.extract_stack()
         # if 'data' in kwargs and len(kwargs['data']) > 500: # anticipate giant data string
         #     kwargs['data'] = f'{kwargs["data"][:500]}...'  
@@ -137,15 +169,16 @@ class NikeScrAPI:
 
     def __requests_call(self,verb, url, **kwargs):
         '''
-        request wrapper call (code from https://stackoverflow.com/questions/16511337/correct-way-to-try-except-using-python-requests-module)
+        request wrapper call, retries and connection pooling are handled by the HTTP client
         '''
         response = None
         exception = None
         try:
-            if 'timeout' not in kwargs:
-                kwargs['timeout'] = self.__DEFAULT_REQUESTS_TIMEOUT
-            response = requests.request(verb, url, **kwargs)
-        except BaseException as e:
+            if verb == 'get':
+                response = self.client.get(url, **kwargs)
+            else:
+                response = self.client.request(verb, url, **kwargs)
+        except Exception as e:
             self.__log_exception(e, verb, url, kwargs)
             exception = e
         return (response, exception)
@@ -177,6 +210,7 @@ class NikeScrAPI:
         '''
         # Gets website page from prod_url
         indiv_shoe_page, exception  = self.__requests_call('get',url)
+        self.metrics.add('ProductPages')
                 
         if not exception :
           indiv_shoe_soup = BeautifulSoup(indiv_shoe_page.text,'html.parser')
@@ -194,7 +228,7 @@ class NikeScrAPI:
         '''        
         old_product_id  = None
 
-        for index in tqdm(df[df['category']==category].index, desc=category.upper()):   
+        for index in df[df['category']==category].index:
 
             shoe = df.loc[index]
             new_product_id = shoe['productID']
@@ -220,7 +254,7 @@ class NikeScrAPI:
 
     def __getProducts(self, category,  anchor=0):
         '''
-        retrieve products from website
+        retrieve products from website, returns (products, pages) or (None, None) for an empty or missing page
         '''    
         country = self.__country
         country_language = self.__lan 
@@ -230,16 +264,31 @@ class NikeScrAPI:
         
         # Nike website's API
         url = f'https://api.nike.com/cic/browse/v2?queryid=products&anonymousId=241B0FAA1AC3D3CB734EA4B24C8C910D&country={country}&endpoint=%2Fproduct_feed%2Frollup_threads%2Fv2%3Ffilter%3Dmarketplace({country})%26filter%3Dlanguage({country_language})%26filter%3DemployeePrice(true)%26searchTerms%3D{query}%26anchor%3D{anchor}%26consumerChannelId%3Dd9a5bc42-4b9c-4976-858a-f159cf99c647%26count%3D{count}&language={country_language}&localizedRangeStr=%7BlowestPrice%7D%E2%80%94%7BhighestPrice%7D'
-        print(url)
+        if self.__DEBUG: print(url)
 
         # Calls API 
-        html, exception = self.__requests_call('get',url)
+        html, exception = self.__requests_call('get',url, cache_ttl=self.__BROWSE_CACHE_TTL)
+        self.metrics.add('BrowsePages')
+
+        # Retries exhausted, ends the search for this category
+        if exception:
+            return None, None
         
-        output = json.loads(html.text)
+        # a 200 that is not JSON (e.g. a bot check page) ends the category like a failed request
+        try:
+            output = json.loads(html.text)
+        except ValueError as e:
+            print(f'Browse page of [{query}] at anchor {anchor} is not JSON: {e}')
+            self.metrics.add('BrowseDecodeFailures')
+            return None, None
 
         if self.__DEBUG : print(f'category:{query} anchor:{anchor} count:{count}')
 
-        return output['data']['products']['products']
+        products = ((output.get('data') or {}).get('products')) or {}
+        if not products.get('products'):
+            return None, None
+
+        return products['products'], products.get('pages') or {}
 
     def __setFilePrefix(self):
         '''
@@ -258,186 +307,376 @@ class NikeScrAPI:
         if not os.path.exists(path):
             os.makedirs(path)
             
-    def __writeIntermediateFile(self, category):
+    def __writeIntermediateFile(self, category, page_number=None):
         '''
-        writes down an intermediate file with last category
+        writes down an intermediate file with the rows added since the last category,
+        page_number labels a partial file written before suspending the crawl.
+        Nothing is written when no rows were added (e.g. suspended again before any progress)
         '''  
+        if len(self.shoeRows) == 0:
+            return
         
-        
-        # get number of current file (out of N categories)
+        # get number of current file (out of N categories), the segment number keeps names unique
+        # when a category is suspended several times
         current = self.categories.index(category) + 1
         label = f'{category}_{current}_of_{len(self.categories)}'
+        if page_number is not None:
+            label = f'{label}_upto_page_{page_number}'
         
-        file_name = f'{self.__filePrefix}_{label}.csv'
+        file_name = f'{self.__filePrefix}_{len(self.__segments)}_{label}.csv'
 
-        file_full_path = os.path.join(self.__path,'tmp',file_name) 
-        
-        # converts data dictionary to dataframe and removes duplicates
-        shoes = pd.DataFrame(self.shoeDict)
+        # converts new rows to dataframe and removes duplicates, including UIDs
+        # already written by previous categories (first occurrence wins)
+        shoes = self.shoeRows.to_frame()
         shoes = shoes.drop_duplicates(subset='UID')
+        shoes = shoes[~shoes['UID'].isin(self.__seen_uids)]
+        self.__seen_uids.update(shoes['UID'])
         
-        # get rows only for current category
-        shoes = shoes[shoes['category']==category]
-        
-        shoes.to_csv(file_full_path)
+        self.__tmp_store.put(file_name, shoes.to_csv(index=False).encode('utf-8'))
+        self.__segments.append(file_name)
+
+        # rows are on the intermediate file now, release them
+        self.shoeRows.clear()
         
-        print(f"Intermediate file for category [{category}] saved as '{file_full_path}'")
-        if self.__DEBUG: print(f'Saved itermediate file {file_full_path}')
+        if self.__DEBUG: print(f'Saved itermediate file {file_name}')
+
+    def __readIntermediateFiles(self):
+        '''
+        concatenates the intermediate files of every category
+        '''
+        dtypes = read_dtypes(PRODUCT_FIELDS)
+        segments = [pd.read_csv(BytesIO(self.__tmp_store.get(key)), dtype=dtypes) for key in self.__segments]
+        segments = [segment for segment in segments if len(segment)]
+        if not segments:
+            return coerce(pd.DataFrame(columns=SHOE_COLUMNS), PRODUCT_FIELDS)
+        # segments have different categories, their concatenation falls back to object columns
+        shoes = pd.concat(segments, ignore_index=True)
+        return coerce(shoes, PRODUCT_FIELDS)
+
+    def __removeIntermediateFiles(self):
+        '''
+        deletes the intermediate files of this run
+        '''
+        for key in self.__segments:
+            self.__tmp_store.delete(key)
+        self.__segments = []
     
     def __writeFinalFile(self, shoes):
         '''
         writes final file name
         '''
-        file_name = f'{self.__filePrefix}.csv'
+        file_name = f'{self.__filePrefix}{extension(self.__output_format)}'
         
         file_full_path = os.path.join(self.__path, file_name)
         # file_full_path = BUCKET_NAME + "/raw/" + self.__path + file_name
         
-        # Saves dataframe as CSV
-        csv_buffer = StringIO()
-        shoes.to_csv(csv_buffer, index=False)
-        
         file_path = "raw/data/products/"
         target_object = file_path + file_name
-            
-        s3_resource.Object(BUCKET_NAME, target_object).put(Body=csv_buffer.getvalue())
-        print(f"CSV successfully written into {file_path}")
+
+        # Streams dataframe as CSV or parquet chunks, uploaded as multipart parts
+        with self.__output_store.open_writer(target_object) as writer:
+            write_frame(shoes, writer, self.__output_format, PRODUCT_FIELDS, self.__compression)
+        self.metrics.add('ProductBytesWritten', writer.bytes_written, 'Bytes')
+        if self.__DEBUG: print(f"{self.__output_format.upper()} successfully written into {file_path}")
         
         self.target_object = target_object
 
-    def __writeDictionary(self,category, k, item, color, short_desc, rating, prod_url):
+    def __fetchPage(self, category, anchor):
         '''
-        add rows to the Data Frame Dictionary
+        downloads a page of products and, if enabled, the description and ratings of its footwear.
+        Returns (footwear, last_page), footwear is None when the page is empty and last_page is the
+        page number (exclusive) where the planner expects the category to end
         '''
-        # add surrogate IDs for shoe and color    
-        self.shoeDict['colorNum'].append(k+1)
-        self.shoeDict['UID'].append(item['cloudProductId']+color['cloudProductId'])
-        self.shoeDict['productID'].append(item['id'])
-        self.shoeDict['cloudProdID'].append(item['cloudProductId'])
-        self.shoeDict['shortID'].append(item['id'][-12:]) 
-        
-        self.shoeDict['type'].append(item['productType'])
-        self.shoeDict['category'].append(category)
-        self.shoeDict['title'].append(item['title'])
-        self.shoeDict['subtitle'].append(item['subtitle'])
-        self.shoeDict['short_description'].append(short_desc)
-        self.shoeDict['rating'].append(rating)                                                                                 
-        
-        self.shoeDict['currency'].append(item['price']['currency'])
-        self.shoeDict['fullPrice'].append(item['price']['fullPrice'])
-        self.shoeDict['sale'].append(item['price']['discounted'])
-        self.shoeDict['currentPrice'].append(item['price']['currentPrice'])
-        self.shoeDict['TopColor'].append(item['colorDescription'])
-        self.shoeDict['channel'].append(item['salesChannel'])
-        self.shoeDict['prod_url'].append(prod_url)
-
-        self.shoeDict['customizable'].append(item['customizable'])
-        self.shoeDict['ExtendedSizing'].append(item['hasExtendedSizing'])          
-        self.shoeDict['inStock'].append(item['inStock'])
-        self.shoeDict['ComingSoon'].append(item['isComingSoon'])
-        self.shoeDict['BestSeller'].append(item['isBestSeller'])
-        self.shoeDict['Excluded'].append(item['isExcluded'])
-        self.shoeDict['GiftCard'].append(item['isGiftCard'])
-        self.shoeDict['Jersey'].append(item['isJersey'])
-        self.shoeDict['Launch'].append(item['isLaunch'])
-        self.shoeDict['MemberExclusive'].append(item['isMemberExclusive'])
-        self.shoeDict['NBA'].append(item['isNBA'])
-        self.shoeDict['NFL'].append(item['isNFL'])
-        self.shoeDict['Sustainable'].append(item['isSustainable'])
-        self.shoeDict['label'].append(item['label'])
-        self.shoeDict['prebuildId'].append(item['prebuildId'])
-
-        # Color Components
-        self.shoeDict['color-ID'].append(color['cloudProductId'])
-        self.shoeDict['color-Description'].append(color['colorDescription'])
-        self.shoeDict['color-FullPrice'].append(color['price']['fullPrice'])
-        self.shoeDict['color-CurrentPrice'].append(color['price']['currentPrice'])
-        self.shoeDict['color-Discount'].append(color['price']['discounted'])
-        self.shoeDict['color-BestSeller'].append(color['isBestSeller'])
-        self.shoeDict['color-Image-url'].append(color['images']['portraitURL']) 
-        self.shoeDict['color-InStock'].append(color['inStock'])
-
-        self.shoeDict['color-MemberExclusive'].append(color['isMemberExclusive'])
-        self.shoeDict['color-New'].append(color['isNew'])
-        self.shoeDict['color-Label'].append(color['label'])        
-        
-    def getData(self):
+        if self.__stopping.is_set():
+            return None, None
+
+        output, pages = self.__getProducts(category=category, anchor=anchor)
+
+        if output == None:
+            return None, None
+
+        footwear = []
+        for item in output:
+
+            # pick only footwear, filtering out everything else      
+            if item['productType'] == 'FOOTWEAR': 
+                
+                # Retrieve short description and ratings this makes the process 10X slower
+                prod_url = item['url'].replace('{countryLang}',self.__url_base)
+                
+                short_desc = np.NaN
+                rating = np.NaN
+                if self.__full_description:
+                    if self.__stopping.is_set():
+                        return None, None
+                    short_desc, rating = self.__getDescAndRatings(prod_url)
+
+                footwear.append((item, short_desc, rating, prod_url))
+
+        return footwear, self.__planner.last_page(pages, anchor // self.__page_size, len(output))
+
+    def __writePage(self, category, footwear):
         '''
-        Happy Scraping! 
-        Main Method to Scrape Data. It cycles across all elements
+        adds the rows of a downloaded page (one per color) to the row builder, returns the number of rows added
         '''
-        # reset file prefix for this run
-        self.__setFilePrefix()
-        # check temp and data directories exist
-        self.__checkPath(self.__path)
-        self.__checkPath(os.path.join(self.__path,'tmp'))
-        
-        # count stores the number of rows scrapped per page
-        count = self.__count
-        anchor = 0
-        total_rows = 0
+        if self.__DEBUG :
+            for j, (item, _, _, _) in enumerate(footwear):
+                for k, color in enumerate(item['colorways']):
+                    print(f"{j}:{k}:{item['cloudProductId'][-12]+color['cloudProductId']}:{item['title']},{item['subtitle']},{color['colorDescription']}")
 
+        return self.shoeRows.add_page(category, footwear)
+
+    def __outOfTime(self):
+        '''
+        True when the invocation is about to reach its deadline. Without a checkpoint the crawl
+        could not be resumed, it runs until it finishes or the invocation times out
+        '''
+        if self.__checkpoint is None or self.__remaining_time is None:
+            return False
+        return self.__remaining_time() < self.__time_margin * 1000
+
+    def __saveCheckpoint(self, category_index, page_number):
+        '''
+        records the position to resume from plus the intermediate files written so far
+        '''
+        if self.__checkpoint is None:
+            return
+        self.__checkpoint.save(
+            file_prefix=self.__filePrefix,
+            category=category_index,
+            page=page_number,
+            segments=self.__segments,
+            seen_uids=sorted(self.__seen_uids),
+            total_rows=self.__total_rows
+        )
+
+    def __suspend(self, category_index, page_number):
+        '''
+        flushes the rows of the current category and saves the checkpoint
+        '''
+        category = self.categories[category_index]
+        self.__writeIntermediateFile(category, page_number)
+        self.__saveCheckpoint(category_index, page_number)
+        print(f"Out of time, crawl suspended at category [{category}] page {page_number}")
+
+    def __finishCategory(self, category_index):
+        '''
+        writes the intermediate file of a completed category and moves the checkpoint to the next one
+        '''
+        self.__writeIntermediateFile(self.categories[category_index])
+        self.__saveCheckpoint(category_index + 1, 0)
+
+    def __scrapeSerial(self, start_category=0, start_page=0):
+        '''
+        walks every category and page one request at a time, stopping where the planner says the category ends.
+        Returns False if the crawl was suspended before the deadline
+        '''
         # get info for each category in the website
-        for category in (self.categories): 
-            # print(f"Processing category '{category.upper()}'")
-            page_number = 0
+        for category_index in range(start_category, len(self.categories)): 
+            category = self.categories[category_index]
+            page_number = start_page if category_index == start_category else 0
+            last_page = self.__max_number_of_pages
 
             # load new pages from the search engine
-            for page_number in tqdm(range(self.__max_number_of_pages), desc=category.upper()):
+            while page_number < last_page:
+
+                if self.__outOfTime():
+                    self.__suspend(category_index, page_number)
+                    return False
 
                 # Get new html page
                 anchor = page_number * self.__page_size  
-                output = self.__getProducts(category=category, anchor=anchor)
-                page_number +=1
-                if self.__DEBUG: print(f'category: {category}, rows: {total_rows}, type(output):{type(output)}')
+                footwear, next_last_page = self.__fetchPage(category, anchor)
+                if self.__DEBUG: print(f'category: {category}, rows: {self.__total_rows}, type(output):{type(footwear)}')
 
                 # If output is empty, breaks the loop, ending the search for this category
-                if output == None:
-                    if self.__DEBUG: print(f'End processing searched {i} pages, {rows} rows, {tenis_rows} footwear')
+                if footwear == None:
+                    if self.__DEBUG: print(f'End processing searched {page_number} pages, {self.__total_rows} rows')
                     break
-                else:
-
-                    # Loop through products and print name
-                    for j, item in enumerate(output):
-
-                        # pick only footwear, filtering out everything else      
-                        if item['productType'] == 'FOOTWEAR': 
-                            
-                            # Retrieve short description and ratings this makes the process 10X slower
-                            prod_url = item['url'].replace('{countryLang}',self.__url_base)
-                            
-                            short_desc = np.NaN
-                            rating = np.NaN
-                            if self.__full_description:
-                                short_desc, rating = self.__getDescAndRatings(prod_url)
-
-                            # Retrieves features for each color 
-                            for k, color in enumerate(item['colorways']):
-                                self.__writeDictionary(category, k, item, color, short_desc, rating, prod_url)
-                                total_rows +=1
-                                
-                                if self.__DEBUG :
-                                    print(f"{j}:{k}:{item['cloudProductId'][-12]+color['cloudProductId']}:{item['title']},{item['subtitle']},{color['colorDescription']}")
+
+                self.__total_rows += self.__writePage(category, footwear)
+
+                last_page = next_last_page
+                page_number += 1
                           
             # writes intermediate file
-            self.__writeIntermediateFile(category)      
+            self.__finishCategory(category_index)
 
+        return True
+
+    def __planCategory(self, pool, category_index, first_page):
+        '''
+        queues the first page of a category in the pool, the pages the planner expects after it are
+        queued as soon as it is downloaded. Returns a Future of (futures, next page number to queue)
+        '''
+        planned = Future()
+        if first_page >= self.__max_number_of_pages:
+            planned.set_result(([], first_page))
+            return planned
+
+        category = self.categories[category_index]
+        first = pool.submit(self.__fetchPage, category, first_page * self.__page_size)
+
+        def plan(first):
+            try:
+                footwear, last_page = first.result()
+                if footwear is None:
+                    last_page = first_page + 1
+                futures = [first] + [
+                    pool.submit(self.__fetchPage, category, page_number * self.__page_size)
+                    for page_number in range(first_page + 1, last_page)
+                ]
+                planned.set_result((futures, max(last_page, first_page + 1)))
+            except BaseException as e:
+                # failed or cancelled page, or pool shut down by a suspension
+                planned.set_exception(e)
+
+        first.add_done_callback(plan)
+        return planned
+
+    def __scrapeConcurrent(self, start_category=0, start_page=0):
+        '''
+        downloads pages of every category in a thread pool of workers threads. The first page of every
+        category is queued at once, the rest of its pages once the category size is known.
+        Results are consumed in category and page order, so rows end up in the same order as the serial path.
+        Returns False if the crawl was suspended before the deadline
+        '''
+        category_range = range(start_category, len(self.categories))
+
+        self.__stopping.clear()
+        pool = ThreadPoolExecutor(max_workers=self.__workers)
+        try:
+            planned = {
+                category_index: self.__planCategory(
+                    pool, category_index, start_page if category_index == start_category else 0
+                )
+                for category_index in category_range
+            }
+
+            for category_index in category_range:
+                category = self.categories[category_index]
+                page_number = start_page if category_index == start_category else 0
+                futures, queued_until = planned[category_index].result()
+                futures = deque(futures)
+
+                while futures:
+                    future = futures.popleft()
+
+                    if self.__outOfTime():
+                        # queued pages are dropped and running fetches stop at their next request,
+                        # the time left is not spent waiting for them
+                        self.__stopping.set()
+                        pool.shutdown(wait=False, cancel_futures=True)
+                        self.__suspend(category_index, page_number)
+                        return False
+
+                    footwear, last_page = future.result()
+
+                    # If output is empty, drop the pages after it, ending the search for this category
+                    if footwear == None:
+                        if self.__DEBUG: print(f'End processing searched {page_number} pages, {self.__total_rows} rows')
+                        for pending in futures:
+                            pending.cancel()
+                        break
+
+                    self.__total_rows += self.__writePage(category, footwear)
+
+                    # categories without totals are followed through their next links or full pages
+                    while queued_until < last_page:
+                        futures.append(pool.submit(self.__fetchPage, category, queued_until * self.__page_size))
+                        queued_until += 1
+
+                    page_number += 1
+
+                # writes intermediate file
+                self.__finishCategory(category_index)
+        except BaseException:
+            # a failed page ends the crawl right away instead of after every queued page
+            self.__stopping.set()
+            raise
+        finally:
+            # running fetches are only waited for when the crawl completed
+            stopping = self.__stopping.is_set()
+            pool.shutdown(wait=not stopping, cancel_futures=stopping)
+
+        return True
+
+    def __recordHttp(self):
+        '''
+        adds the latencies and per host counters of the HTTP client to the metrics
+        '''
+        if self.metrics.enabled:
+            self.metrics.observe('HttpLatency', self.client.stats.latencies())
+            self.metrics.property('HttpHosts', self.client.stats.summary())
+
+    def getData(self, remaining_time=None):
+        '''
+        Happy Scraping! 
+        Main Method to Scrape Data. It cycles across all elements
+        remaining_time: callable returning the milliseconds left (Lambda context.get_remaining_time_in_millis),
+        only used when a checkpoint is configured.
+        Returns None when the crawl was suspended, a later call resumes from the checkpoint
+        '''
+        self.__remaining_time = remaining_time
+        self.complete = False
+
+        # check data directory exists
+        self.__checkPath(self.__path)
+
+        state = self.__checkpoint.load() if self.__checkpoint else None
+        if state:
+            self.__filePrefix = state['file_prefix']
+            self.__segments = state['segments']
+            self.__seen_uids = set(state['seen_uids'])
+            self.__total_rows = state['total_rows']
+            start_category, start_page = state['category'], state['page']
+            print(f"Resuming '{self.__filePrefix}' from category {start_category} page {start_page}")
+        else:
+            # reset file prefix for this run
+            self.__setFilePrefix()
+            self.__segments = []
+            self.__seen_uids = set()
+            self.__total_rows = 0
+            start_category, start_page = 0, 0
         
-        # Remove Dupes
-        shoes = pd.DataFrame(self.shoeDict)
-        shoes = shoes.drop_duplicates(subset='UID')
-        
-        self.__writeFinalFile(shoes)
+        with self.metrics.stage('Crawl'):
+            if self.__workers > 1:
+                completed = self.__scrapeConcurrent(start_category, start_page)
+            else:
+                completed = self.__scrapeSerial(start_category, start_page)
+
+        if not completed:
+            if self.client.cache is not None:
+                self.client.cache.flush()
+            self.__recordHttp()
+            return None
+
+        total_rows = self.__total_rows
+
+        # Intermediate files are already free of dupes
+        with self.metrics.stage('MergeSegments'):
+            shoes = self.__readIntermediateFiles()
         
-        # final message
-        print(f'\nScraping Finished, Total {total_rows} items processed')
-        print(f"total rows in dataframe:{len(shoes['UID'])}, unique rows:{len(shoes['UID'].unique())}")
+        with self.metrics.stage('WriteProducts'):
+            self.__writeFinalFile(shoes)
         
-        file_full_path = os.path.join(f'{self.__filePrefix}.csv', self.__path) 
-        print(f"final dataset file saved as '{file_full_path}'")
-
-        print("removing temporal files")
-        shutil.rmtree(f'{self.__path}/tmp')
+        # rows in (one per product colorway scraped) and out (unique UIDs written)
+        self.metrics.add('ProductRowsIn', total_rows)
+        self.metrics.add('ProductRowsOut', len(shoes))
+        self.metrics.set('DedupRatio', round(1 - len(shoes) / total_rows, 4) if total_rows else 0.0)
+        self.metrics.property('ProductsTarget', self.target_object)
+        if self.__DEBUG:
+            print(f'\nScraping Finished, Total {total_rows} items processed')
+            print(f"total rows in dataframe:{len(shoes['UID'])}, unique rows:{len(shoes['UID'].unique())}")
+
+        if self.client.cache is not None:
+            self.client.cache.flush()
+            self.metrics.property('HttpCache', self.client.cache.stats())
+        self.__recordHttp()
+
+        self.__removeIntermediateFiles()
+        if self.__checkpoint is not None:
+            self.__checkpoint.clear()
+        self.complete = True
         
         return shoes
-
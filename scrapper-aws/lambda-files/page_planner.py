@@ -0,0 +1,26 @@
+import math
+
+
+class PagePlanner():
+    """
+    Decides which browse API pages of a category exist, from the 'pages' block of a response:
+        {'prev': '', 'next': '/product_feed/...&anchor=24...', 'totalPages': 10, 'totalResources': 232}
+    page_size: products per page (browse API count)
+    max_pages: upper bound of pages per category
+    """
+    def __init__(self, page_size: int, max_pages: int):
+        self.page_size = page_size
+        self.max_pages = max_pages
+
+    def last_page(self, pages: dict, page_number: int, products: int = None):
+        """
+        returns the page number (exclusive) where the category ends, given the pages block of page_number
+        and the number of products it returned. Uses totalResources when reported, otherwise the next link
+        (one more page at a time). Without a pages block, one more page is planned while pages come back full
+        """
+        total = pages.get('totalResources')
+        if isinstance(total, int):
+            return min(self.max_pages, math.ceil(total / self.page_size))
+        if pages.get('next') or (not pages and products == self.page_size):
+            return min(self.max_pages, page_number + 2)
+        return page_number + 1
@@ -0,0 +1,155 @@
+from operator import itemgetter
+
+import numpy as np
+import pandas as pd
+
+from nike_schema import PRODUCT_FIELDS, column_names, coerce
+
+# Output columns in file order, numeric columns are kept as typed arrays
+SHOE_COLUMNS = column_names(PRODUCT_FIELDS)
+TYPED_COLUMNS = {name: np.dtype(kind) for name, kind in PRODUCT_FIELDS if kind in ('int32', 'int64', 'float64')}
+
+# column: key in the product (item) of the browse API
+ITEM_FIELDS = {
+    'cloudProdID': 'cloudProductId',
+    'productID': 'id',
+    'type': 'productType',
+    'title': 'title',
+    'subtitle': 'subtitle',
+    'TopColor': 'colorDescription',
+    'channel': 'salesChannel',
+    'customizable': 'customizable',
+    'ExtendedSizing': 'hasExtendedSizing',
+    'inStock': 'inStock',
+    'ComingSoon': 'isComingSoon',
+    'BestSeller': 'isBestSeller',
+    'Excluded': 'isExcluded',
+    'GiftCard': 'isGiftCard',
+    'Jersey': 'isJersey',
+    'Launch': 'isLaunch',
+    'MemberExclusive': 'isMemberExclusive',
+    'NBA': 'isNBA',
+    'NFL': 'isNFL',
+    'Sustainable': 'isSustainable',
+    'label': 'label',
+    'prebuildId': 'prebuildId',
+}
+ITEM_PRICE_FIELDS = {
+    'currency': 'currency',
+    'fullPrice': 'fullPrice',
+    'sale': 'discounted',
+    'currentPrice': 'currentPrice',
+}
+# column: key in each of the product colorways
+COLOR_FIELDS = {
+    'color-ID': 'cloudProductId',
+    'color-Description': 'colorDescription',
+    'color-BestSeller': 'isBestSeller',
+    'color-InStock': 'inStock',
+    'color-MemberExclusive': 'isMemberExclusive',
+    'color-New': 'isNew',
+    'color-Label': 'label',
+}
+COLOR_PRICE_FIELDS = {
+    'color-FullPrice': 'fullPrice',
+    'color-CurrentPrice': 'currentPrice',
+    'color-Discount': 'discounted',
+}
+
+
+class ShoeRows():
+    """
+    Columnar accumulator for the scraped rows (one row per product colorway).
+    Object columns are python lists, numeric columns are lists of typed numpy chunks (one per page)
+    """
+    def __init__(self):
+        self.__columns = {name: [] for name in SHOE_COLUMNS}
+        self.__rows = 0
+
+    def __len__(self):
+        return self.__rows
+
+    def __extend(self, name, values):
+        if name in TYPED_COLUMNS:
+            self.__columns[name].append(np.asarray(values, dtype=TYPED_COLUMNS[name]))
+        else:
+            self.__columns[name].extend(values)
+
+    def add_page(self, category: str, footwear: list):
+        """
+        flattens a page of products and their colorways in one batch.
+        footwear: list of (item, short_desc, rating, prod_url) as built by NikeScrAPI
+        Returns the number of rows added
+        """
+        items, colors, color_nums, descs, ratings, urls = [], [], [], [], [], []
+        for item, short_desc, rating, prod_url in footwear:
+            for k, color in enumerate(item['colorways']):
+                items.append(item)
+                colors.append(color)
+                color_nums.append(k + 1)
+            n = len(item['colorways'])
+            descs.extend([short_desc] * n)
+            ratings.extend([rating] * n)
+            urls.extend([prod_url] * n)
+
+        rows = len(items)
+        if rows == 0:
+            return 0
+
+        item_prices = list(map(itemgetter('price'), items))
+        color_prices = list(map(itemgetter('price'), colors))
+
+        for name, key in ITEM_FIELDS.items():
+            self.__extend(name, list(map(itemgetter(key), items)))
+        for name, key in ITEM_PRICE_FIELDS.items():
+            self.__extend(name, list(map(itemgetter(key), item_prices)))
+        for name, key in COLOR_FIELDS.items():
+            self.__extend(name, list(map(itemgetter(key), colors)))
+        for name, key in COLOR_PRICE_FIELDS.items():
+            self.__extend(name, list(map(itemgetter(key), color_prices)))
+
+        # add surrogate IDs for shoe and color
+        product_ids = self.__columns['cloudProdID'][-rows:]
+        color_ids = self.__columns['color-ID'][-rows:]
+        self.__extend('UID', [p + c for p, c in zip(product_ids, color_ids)])
+        self.__extend('shortID', [product_id[-12:] for product_id in self.__columns['productID'][-rows:]])
+        self.__extend('colorNum', color_nums)
+        self.__extend('category', [category] * rows)
+        self.__extend('short_description', descs)
+        self.__extend('rating', ratings)
+        self.__extend('prod_url', urls)
+        self.__extend('color-Image-url', [color['images']['portraitURL'] for color in colors])
+
+        self.__rows += rows
+        return rows
+
+    def clear(self):
+        """
+        drops every accumulated row
+        """
+        for values in self.__columns.values():
+            values.clear()
+        self.__rows = 0
+
+    def __column(self, name, start):
+        values = self.__columns[name]
+        if name in TYPED_COLUMNS:
+            values = np.concatenate(values) if values else np.empty(0, dtype=TYPED_COLUMNS[name])
+            return values[start:]
+        column = np.empty(self.__rows - start, dtype=object)
+        column[:] = values[start:]
+        return column
+
+    def to_frame(self, start: int = 0):
+        """
+        returns the rows from position start onwards as a DataFrame, columns in SHOE_COLUMNS order
+        with the dtypes of the shared schema
+        """
+        frame = pd.DataFrame({name: self.__column(name, start) for name in SHOE_COLUMNS}, copy=False)
+        return coerce(frame, PRODUCT_FIELDS)
+
+    def to_dict(self):
+        """
+        dictionary of lists, same layout as the former NikeScrAPI.shoeDict
+        """
+        return {name: list(self.__column(name, 0)) for name in SHOE_COLUMNS}
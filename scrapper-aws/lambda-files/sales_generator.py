@@ -1,69 +1,211 @@
 from datetime import date, timedelta
-import time
 import pandas
-import random
+import numpy
 import os
-import boto3
-from io import StringIO
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from storage import open_store
+from lake_format import write_batches, extension, SALES_FIELDS
+from nike_schema import column_names, coerce
+from nike_metrics import Metrics
 
 BUCKET_NAME = os.environ["BUCKET_NAME"]
-s3_resource = boto3.resource('s3')
+
+# catalog and settings of the SalesGenerator, set once in every worker process
+_worker = {}
+
+
+def _init_worker(catalog: tuple, settings: dict):
+    _worker['catalog'] = catalog
+    _worker['settings'] = settings
+
+
+def _generate_in_worker(day: date):
+    return generate_day(_worker['catalog'], _worker['settings'], day)
+
+
+class TicketIdAllocator():
+    """
+    Issues unique ticket ids in vectorized blocks: YYYYMMDD followed by a 7 digits per-day sequence
+    """
+    __digits = 7
+
+    def __init__(self):
+        self.__next = {}
+
+    def allocate(self, day: date, count: int):
+        """
+        returns count new ids for day as an int64 array
+        """
+        key = int(day.strftime('%Y%m%d'))
+        start = self.__next.get(key, 0)
+        end = start + count
+        if end > 10**self.__digits - 1:
+            raise ValueError(f"Ticket sequence exhausted for {day.strftime('%Y-%m-%d')}")
+        self.__next[key] = end
+
+        sequence = numpy.arange(start + 1, end + 1, dtype=numpy.int64)
+        return key * 10**self.__digits + sequence
+
+
+# products whose numbers are drawn from the same random stream. Fixed, so the sales of a seed do not
+# depend on chunk_size, and small, so a day never needs arrays sized by the whole catalog
+_BLOCK_PRODUCTS = 4096
+
+
+def _block_rng(settings: dict, day: date, block: int):
+    """
+    each block of products of a day has its own random stream derived from (seed, day, block), so results
+    do not depend on the order or the worker where days are generated, nor on the batches they are written in
+    """
+    return numpy.random.default_rng(numpy.random.SeedSequence(settings['seed'], spawn_key=(day.toordinal(), block)))
+
+
+def _draw(settings: dict, day: date, block: int, products: int):
+    """
+    draws the numbers of a block of products: tickets per product (which products sell) and quantity per ticket.
+    Only numeric arrays, the rows are built from them by _frame
+    """
+    rng = _block_rng(settings, day, block)
+    # a product sells on 1 out of chance days, then gets between min and max tickets
+    sells = rng.integers(1, settings['chance'], size=products, endpoint=True) == settings['chance']
+    tickets = rng.integers(settings['min_sales'], settings['max_sales'], size=products, endpoint=True)
+    tickets[~sells] = 0
+
+    # quantities are 1 to max_qty items, one byte each
+    qty = rng.integers(settings['min_qty'], settings['max_qty'], size=int(tickets.sum()), endpoint=True, dtype=numpy.int8)
+    return tickets, qty
+
+
+def _iter_draws(settings: dict, day: date, products: int, chunk_size: int):
+    """
+    yields (start, end, tickets, qty) for the products of the catalog in order, at most chunk_size
+    products at a time. Only the draws of one block are held at once
+    """
+    for block, block_start in enumerate(range(0, products, _BLOCK_PRODUCTS)):
+        block_end = min(block_start + _BLOCK_PRODUCTS, products)
+        tickets, qty = _draw(settings, day, block, block_end - block_start)
+        # position of the first ticket of every product in qty
+        offsets = numpy.concatenate(([0], numpy.cumsum(tickets)))
+        for start in range(0, block_end - block_start, chunk_size):
+            end = min(start + chunk_size, block_end - block_start)
+            yield block_start + start, block_start + end, tickets[start:end], qty[offsets[start]:offsets[end]]
+
+
+def _frame(ids: TicketIdAllocator, settings: dict, day: date, uids, currencies, prices, tickets, qty):
+    """
+    sales rows of a set of products, tickets and qty are the draws of those products
+    """
+    product = numpy.repeat(numpy.arange(len(uids)), tickets)
+
+    # ticket_id is YYYYMMDD followed by a 7 digits sequence, unique within the day
+    ticket_id = ids.allocate(day, len(product))
+
+    return coerce(pandas.DataFrame({
+        'ticket_id': ticket_id,
+        'UID': uids[product],
+        'currency': currencies[product],
+        'sales': prices[product] * qty,
+        'quantity': qty,
+        'date': pandas.Timestamp(day).normalize(),
+    }, columns=settings['columns']), SALES_FIELDS)
+
+
+def generate_day(catalog: tuple, settings: dict, day: date):
+    """
+    generates the sales of a whole day in one frame
+    catalog: (uids, currencies, prices) arrays
+    """
+    uids, currencies, prices = catalog
+    draws = list(_iter_draws(settings, day, len(uids), _BLOCK_PRODUCTS))
+    tickets = numpy.concatenate([numpy.zeros(0, dtype=numpy.int64)] + [tickets for _, _, tickets, _ in draws])
+    qty = numpy.concatenate([numpy.zeros(0, dtype=numpy.int8)] + [qty for _, _, _, qty in draws])
+    return _frame(TicketIdAllocator(), settings, day, uids, currencies, prices, tickets, qty)
+
+
+def iter_day(catalog: tuple, settings: dict, day: date, chunk_size: int):
+    """
+    yields the sales of a day in batches of at most chunk_size products. The numbers are drawn per block
+    of products, so the batches hold the same rows as generate_day whatever the chunk_size, and memory
+    depends on chunk_size and the block size instead of the catalog size
+    """
+    uids, currencies, prices = catalog
+    ids = TicketIdAllocator()
+    for start, end, tickets, qty in _iter_draws(settings, day, len(uids), chunk_size):
+        yield _frame(ids, settings, day, uids[start:end], currencies[start:end], prices[start:end], tickets, qty)
+
 
 class SalesGenerator():
 
     """
     min_qty: Minimum items per ticket (must not be zero)
     max_qty: Maximum items per ticket (must be non zero and equal or higher than min_sales)
-    min_index: Minimum random for ticket_id
-    max_index: Maximum random for ticket_id
     """
     __min_qty = 1
     __max_qty = 5
-    __column_names = ['ticket_id', 'UID', 'currency', 'sales', 'quantity', 'date']
+    __column_names = column_names(SALES_FIELDS)
     __file_prefix = 'nike_sales_'
 
-    __min_index=1
-    __max_index=1000000
-
     def __init__(self,
                  nike_df: pandas.DataFrame,
                  min_sales: int,
                  max_sales: int,
                  path='data/sales',
-                 chance=2):
+                 chance=2,
+                 output_location=None,
+                 output_format='csv',
+                 compression='snappy',
+                 seed=None,
+                 workers=1,
+                 use_processes=True,
+                 max_in_flight=None,
+                 chunk_size=None,
+                 metrics=None):
         """
         nike_df: Dataframe from NikeScrAPI.getData()
         min_sales: minimum ammount of ticket per product per day (can be zero)
         max_sales: maximum ammount of ticket per product per day (must be non zero and equal or higher than min_sales)
         path: output folder (suggested default value),
         chance: chance of not selling an item per day (1/n) chance of occurring (if this occurs the min_sales and max_sales are not applied)
+        output_location: store for the sales files, data lake bucket by default (local folder or 's3://bucket/prefix')
+        output_format: 'csv' or 'parquet' (fixed schema, compression 'snappy' or 'zstd')
+        seed: random seed, the same seed and catalog generate the same sales regardless of workers and chunk_size
+        workers: days generated in parallel by generate_interval
+        use_processes: process pool for the workers, threads otherwise (Lambda has no /dev/shm for process pools)
+        max_in_flight: days generated but not yet written kept in memory (defaults to workers + 1)
+        chunk_size: products per batch in streaming mode, every day is written batch by batch as it is
+                    generated so memory depends on chunk_size instead of catalog size (None generates whole days)
+        metrics: Metrics receiving the generation time, rows and bytes written (no-op by default)
         """
-        self.__df = nike_df
-        self.__min = min_sales
-        self.__max = max_sales
         self.__path = path
-        self.__chance = chance  # chance of a record of NOT being generated 1/n for every day/product
+        self.__store = open_store(output_location or f's3://{BUCKET_NAME}')
+        self.__output_format = output_format
+        self.__compression = compression
+        self.__workers = max(1, workers)
+        self.__use_processes = use_processes
+        self.__max_in_flight = max_in_flight or self.__workers + 1
+        self.__chunk_size = chunk_size
+        self.metrics = metrics or Metrics()
+
+        # catalog columns used for every ticket, as arrays
+        self.__catalog = (
+            nike_df['UID'].to_numpy(),
+            nike_df['currency'].to_numpy(),
+            nike_df['currentPrice'].to_numpy(dtype=float),
+        )
+        self.__settings = {
+            'seed': seed if seed is not None else numpy.random.SeedSequence().entropy,
+            'min_sales': min_sales,
+            'max_sales': max_sales,
+            'chance': chance,
+            'min_qty': self.__min_qty,
+            'max_qty': self.__max_qty,
+            'columns': self.__column_names,
+        }
 
     def __generate_day(self, day: date):
-        df = pandas.DataFrame([], columns=self.__column_names)
-        for _, row in self.__df.iterrows():
-            chance = random.randint(1, self.__chance)
-            if (chance == self.__chance):
-                sales = random.randint(self.__min, self.__max)
-                for _ in range(sales):
-                    qty = random.randint(self.__min_qty, self.__max_qty)
-                    df.loc[len(df)] = [
-                        int('{date}{random}'.format(
-                            date=day.strftime('%Y%m%d'),
-                            random=str(random.randint(self.__min_index, self.__max_index)).zfill(7)
-                        )),
-                        row['UID'],
-                        row['currency'],
-                        row['currentPrice'] * qty,
-                        qty,
-                        day.strftime('%Y-%m-%d')
-                    ]
-        return df
+        return generate_day(self.__catalog, self.__settings, day)
  
     def __create_folders(self, date: date):
         path = '{path}/{date_folder}'.format(
@@ -72,19 +214,74 @@ class SalesGenerator():
             )
         return path
 
+    def __count_rows(self, batches):
+        for batch in batches:
+            self.metrics.add('SalesRowsOut', len(batch))
+            yield batch
+
+    def __write_day(self, single_date: date, batches):
+        """
+        writes the sales batches of a day, returns the object key
+        """
+        file_name="{}{}{}".format(self.__file_prefix, single_date.strftime('%Y_%m_%d'), extension(self.__output_format))
+        path = self.__create_folders(single_date)
+        file_full_path = path + '/' + file_name
+        
+        target_object = "raw/" + file_full_path
+
+        with self.__store.open_writer(target_object) as writer:
+            write_batches(self.__count_rows(batches), writer, self.__output_format, SALES_FIELDS, self.__compression)
+        self.metrics.add('SalesFiles')
+        self.metrics.add('SalesBytesWritten', writer.bytes_written, 'Bytes')
+        return target_object
+
+    def __stream_day(self, single_date: date):
+        return self.__write_day(single_date, iter_day(self.__catalog, self.__settings, single_date, self.__chunk_size))
+
+    def __pool(self):
+        if self.__use_processes:
+            pool = ProcessPoolExecutor(self.__workers, initializer=_init_worker, initargs=(self.__catalog, self.__settings))
+            return pool, lambda day: pool.submit(_generate_in_worker, day)
+        pool = ThreadPoolExecutor(self.__workers)
+        return pool, lambda day: pool.submit(generate_day, self.__catalog, self.__settings, day)
+
     def generate_interval(self, start: date, end: date):
+        with self.metrics.stage('GenerateSales'):
+            self.__generate_interval(start, end)
+        self.metrics.add('SalesProductsIn', len(self.__catalog[0]))
+
+    def __generate_interval(self, start: date, end: date):
         day_count = (end - start).days + 1
-        for single_date in (start + timedelta(n) for n in range(day_count)):
-            df = self.__generate_day(single_date)
-            file_name="{}{}.csv".format(self.__file_prefix, single_date.strftime('%Y_%m_%d'))
-            path = self.__create_folders(single_date)
-            file_full_path = path + '/' + file_name
-            
-            csv_buffer = StringIO()
-            df.to_csv(csv_buffer, index=False)
-                
-            target_object = "raw/" + file_full_path
-            self.target_object = target_object
-                
-            s3_resource.Object(BUCKET_NAME, target_object).put(Body=csv_buffer.getvalue())
-            print(f"CSV successfully written into {target_object}")
\ No newline at end of file
+        days = [start + timedelta(n) for n in range(day_count)]
+
+        if self.__chunk_size:
+            # streaming mode, each day goes batch by batch into its own writer
+            if self.__workers == 1:
+                targets = [self.__stream_day(single_date) for single_date in days]
+            else:
+                with ThreadPoolExecutor(self.__workers) as pool:
+                    targets = list(pool.map(self.__stream_day, days))
+
+        elif self.__workers == 1:
+            targets = [self.__write_day(single_date, [self.__generate_day(single_date)]) for single_date in days]
+
+        else:
+            # days are generated in the pool while the oldest finished day is written,
+            # at most max_in_flight days are kept in memory
+            targets = []
+            pool, submit = self.__pool()
+            with pool:
+                in_flight = deque()
+                for single_date in days:
+                    if len(in_flight) == self.__max_in_flight:
+                        oldest_date, oldest = in_flight.popleft()
+                        targets.append(self.__write_day(oldest_date, [oldest.result()]))
+                    in_flight.append((single_date, submit(single_date)))
+
+                while in_flight:
+                    oldest_date, oldest = in_flight.popleft()
+                    targets.append(self.__write_day(oldest_date, [oldest.result()]))
+
+        # every object written, in day order (target_object is kept for the last day)
+        self.target_objects = targets
+        self.target_object = targets[-1]
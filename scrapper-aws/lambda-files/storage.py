@@ -0,0 +1,240 @@
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore
+
+import boto3
+
+# S3 multipart parts must be at least 5 MiB (except the last one)
+PART_SIZE = 8 * 1024 * 1024
+
+
+class LocalWriter():
+    """
+    Streaming writer for LocalStore, the file appears under its key once closed
+    """
+    def __init__(self, path: str):
+        self.__path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.__file = open(path + '.part', 'wb')
+        self.bytes_written = 0
+        self.closed = False
+
+    def write(self, data: bytes):
+        self.__file.write(data)
+        self.bytes_written += len(data)
+
+    def tell(self):
+        return self.bytes_written
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.__file.close()
+        os.replace(self.__path + '.part', self.__path)
+        self.closed = True
+
+    def abort(self):
+        self.__file.close()
+        os.remove(self.__path + '.part')
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class MultipartWriter():
+    """
+    Streaming writer for S3Store. Data is buffered into parts of part_size bytes that are
+    uploaded concurrently, at most max_in_flight parts are held in memory at once.
+    Objects smaller than a part are sent with a single put
+    """
+    def __init__(self, client, bucket: str, key: str, part_size=PART_SIZE, max_in_flight=4):
+        self.__client = client
+        self.__bucket = bucket
+        self.__key = key
+        self.__part_size = part_size
+        self.__buffer = bytearray()
+        self.__upload_id = None
+        self.__parts = []
+        self.__slots = BoundedSemaphore(max_in_flight)
+        self.__pool = ThreadPoolExecutor(max_workers=max_in_flight)
+        self.bytes_written = 0
+        self.closed = False
+
+    def __uploadPart(self, number: int, body: bytes):
+        try:
+            response = self.__client.upload_part(
+                Bucket=self.__bucket, Key=self.__key, UploadId=self.__upload_id, PartNumber=number, Body=body
+            )
+            return {'PartNumber': number, 'ETag': response['ETag']}
+        finally:
+            self.__slots.release()
+
+    def __flushPart(self):
+        if self.__upload_id is None:
+            self.__upload_id = self.__client.create_multipart_upload(Bucket=self.__bucket, Key=self.__key)['UploadId']
+        body = bytes(self.__buffer[:self.__part_size])
+        del self.__buffer[:self.__part_size]
+        self.__slots.acquire()
+        self.__parts.append(self.__pool.submit(self.__uploadPart, len(self.__parts) + 1, body))
+
+    def write(self, data: bytes):
+        self.__buffer += data
+        self.bytes_written += len(data)
+        while len(self.__buffer) >= self.__part_size:
+            self.__flushPart()
+
+    def tell(self):
+        return self.bytes_written
+
+    def flush(self):
+        pass
+
+    def close(self):
+        try:
+            if self.__upload_id is None:
+                self.__client.put_object(Bucket=self.__bucket, Key=self.__key, Body=bytes(self.__buffer))
+                return
+            if self.__buffer:
+                self.__flushPart()
+            parts = [part.result() for part in self.__parts]
+            self.__client.complete_multipart_upload(
+                Bucket=self.__bucket, Key=self.__key, UploadId=self.__upload_id, MultipartUpload={'Parts': parts}
+            )
+        except Exception:
+            self.abort()
+            raise
+        finally:
+            self.__pool.shutdown()
+            self.closed = True
+
+    def abort(self):
+        self.closed = True
+        self.__pool.shutdown(cancel_futures=True)
+        if self.__upload_id is not None:
+            self.__client.abort_multipart_upload(Bucket=self.__bucket, Key=self.__key, UploadId=self.__upload_id)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class LocalStore():
+    """
+    Key/value object store on local disk, keys are relative paths under root
+    """
+    def __init__(self, root: str):
+        self.root = root
+
+    def __path(self, key: str):
+        return os.path.join(self.root, *key.split('/'))
+
+    def put(self, key: str, body: bytes):
+        path = self.__path(key)
+        folder = os.path.dirname(path)
+        os.makedirs(folder, exist_ok=True)
+        # write then rename, so readers never see a partial object. Each put has its own
+        # temporary file, concurrent puts of a key do not race on it (the last rename wins)
+        descriptor, part = tempfile.mkstemp(dir=folder, prefix=os.path.basename(path) + '.', suffix='.part')
+        try:
+            with os.fdopen(descriptor, 'wb') as f:
+                f.write(body)
+            os.replace(part, path)
+        except BaseException:
+            if os.path.exists(part):
+                os.remove(part)
+            raise
+
+    def get(self, key: str):
+        """
+        returns the object bytes or None if the key does not exist
+        """
+        try:
+            with open(self.__path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def open_writer(self, key: str, **kwargs):
+        return LocalWriter(self.__path(key))
+
+    def delete(self, key: str):
+        try:
+            os.remove(self.__path(key))
+        except FileNotFoundError:
+            pass
+
+    def list(self, prefix: str = ''):
+        keys = []
+        for folder, _, files in os.walk(self.root):
+            for name in files:
+                if name.endswith('.part'):
+                    continue
+                key = os.path.relpath(os.path.join(folder, name), self.root).replace(os.sep, '/')
+                if key.startswith(prefix):
+                    keys.append(key)
+        return sorted(keys)
+
+
+class S3Store():
+    """
+    Key/value object store on an S3 bucket, keys are relative to prefix
+    """
+    def __init__(self, bucket: str, prefix: str = '', client=None):
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        self.client = client or boto3.client('s3')
+
+    def __key(self, key: str):
+        return f'{self.prefix}/{key}' if self.prefix else key
+
+    def put(self, key: str, body: bytes):
+        self.client.put_object(Bucket=self.bucket, Key=self.__key(key), Body=body)
+
+    def get(self, key: str):
+        """
+        returns the object bytes or None if the key does not exist
+        """
+        try:
+            obj = self.client.get_object(Bucket=self.bucket, Key=self.__key(key))
+        except self.client.exceptions.NoSuchKey:
+            return None
+        return obj['Body'].read()
+
+    def open_writer(self, key: str, part_size=PART_SIZE, max_in_flight=4):
+        return MultipartWriter(self.client, self.bucket, self.__key(key), part_size, max_in_flight)
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self.__key(key))
+
+    def list(self, prefix: str = ''):
+        keys = []
+        skip = len(self.prefix) + 1 if self.prefix else 0
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.__key(prefix)):
+            keys.extend(obj['Key'][skip:] for obj in page.get('Contents', []))
+        return sorted(keys)
+
+
+def open_store(location: str):
+    """
+    returns a store for 's3://bucket/prefix' locations or a local folder otherwise
+    """
+    if location.startswith('s3://'):
+        bucket, _, prefix = location[len('s3://'):].partition('/')
+        return S3Store(bucket, prefix)
+    return LocalStore(location)
+
@@ -79,8 +79,14 @@ resource "aws_sfn_state_machine" "sfn_state_machine" {
     definition = <<EOF
     {
         "Comment": "A description of my state machine",
-        "StartAt": "Run Scraper",
+        "StartAt": "Start Crawl",
         "States": {
+            "Start Crawl": {
+            "Type": "Pass",
+            "Comment": "Counts the scraper invocations of the crawl",
+            "Result": {"invocation": 0},
+            "Next": "Run Scraper"
+            },
             "Run Scraper": {
             "Type": "Task",
             "Resource": "arn:aws:states:::lambda:invoke",
@@ -91,7 +97,14 @@ resource "aws_sfn_state_machine" "sfn_state_machine" {
                 "max_pages": 10,
                 "day_count": 0,
                 "min_sales": 0,
-                "max_sales": 4
+                "max_sales": 4,
+                "workers": 16,
+                "max_per_host": 8,
+                "cache": "s3://enroute-project/cache/http",
+                "tmp_location": "s3://enroute-project/cache/tmp",
+                "checkpoint": "s3://enroute-project/cache/checkpoint",
+                "time_margin": 120,
+                "invocation.$": "States.MathAdd($.invocation, 1)"
                 }
             },
             "Retry": [
@@ -107,7 +120,30 @@ resource "aws_sfn_state_machine" "sfn_state_machine" {
                 "BackoffRate": 2
                 }
             ],
-            "Next": "Transform Step"
+            "Next": "Scraper Finished?"
+            },
+            "Scraper Finished?": {
+            "Type": "Choice",
+            "Choices": [
+                {
+                "And": [
+                    {"Variable": "$.status", "StringEquals": "IN_PROGRESS"},
+                    {"Variable": "$.invocation", "NumericLessThan": 20}
+                ],
+                "Next": "Run Scraper"
+                },
+                {
+                "Variable": "$.status",
+                "StringEquals": "IN_PROGRESS",
+                "Next": "Scraper Out Of Invocations"
+                }
+            ],
+            "Default": "Transform Step"
+            },
+            "Scraper Out Of Invocations": {
+            "Type": "Fail",
+            "Error": "ScraperOutOfInvocations",
+            "Cause": "The crawl was suspended 20 times without finishing, see the scraper logs"
             },
             "Transform Step": {
             "Type": "Task",
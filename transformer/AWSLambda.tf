@@ -1,3 +1,6 @@
+# Shared column schema layer
+variable "schema_layer_arn" {}
+
 # IAM role for lambda
 resource "aws_iam_role" "lambda_role" {
     name = "scraper_lambda_role"
@@ -27,8 +30,9 @@ resource "aws_lambda_function" "test_lambda" {
   source_code_hash = data.archive_file.origin_request_lambda_source.output_base64sha256  # Hash of the source code
   filename     = data.archive_file.origin_request_lambda_source.output_path  # Path to the Lambda deployment package
   timeout      = 60  # Maximum execution time for the Lambda function (in seconds)
-  memory_size  = 1024  # Memory allocated to the Lambda function (in MB)
-  layers = ["arn:aws:lambda:us-east-1:770693421928:layer:Klayers-p311-pandas:5", "arn:aws:lambda:us-east-1:693071886825:layer:snowflake-connector-python:4"]
+  memory_size  = 512  # Memory allocated to the Lambda function (in MB), sales files are streamed in chunks
+  # AWS SDK for pandas (AWS managed) provides pandas, numpy and pyarrow to read parquet lake files
+  layers = ["arn:aws:lambda:us-east-1:336392948345:layer:AWSSDKPandas-Python311:12", "arn:aws:lambda:us-east-1:693071886825:layer:snowflake-connector-python:4", var.schema_layer_arn]
   environment {
     variables = {
       S3_BUCKET = "enroute-project"  # Environment variables for the Lambda function
@@ -36,6 +40,7 @@ resource "aws_lambda_function" "test_lambda" {
       DATABASE = "AWS_TEST"
       REGION = "us-east-1"
       SCHEMA = "PUBLIC"
+      METRICS_SINK = "emf"  # run metrics as CloudWatch EMF log records, "off" disables them
       WAREHOUSE = "COMPUTE_WH"
     }
   }
@@ -0,0 +1,93 @@
+import json
+import time
+
+
+class SecretCache():
+    """
+    Secrets Manager values kept for ttl seconds, so warm invocations skip the call
+    client: boto3 secretsmanager client
+    """
+    def __init__(self, client, ttl=900):
+        self.__client = client
+        self.__ttl = ttl
+        self.__values = {}
+
+    def get(self, secret_id: str):
+        """
+        returns the secret string parsed as JSON
+        """
+        value, fetched = self.__values.get(secret_id, (None, 0))
+        if value is None or time.monotonic() - fetched > self.__ttl:
+            response = self.__client.get_secret_value(SecretId=secret_id)
+            value = json.loads(response['SecretString'])
+            self.__values[secret_id] = (value, time.monotonic())
+        return value
+
+    def invalidate(self, secret_id: str):
+        self.__values.pop(secret_id, None)
+
+
+class ConnectionManager():
+    """
+    Keeps a warehouse connection alive across warm invocations of a Lambda container.
+    The connection is health checked before being handed out and reopened when it went stale
+    open_warehouse: callable(secret) returning a connected Warehouse
+    secrets: SecretCache holding the credentials
+    secret_id: id of the credentials secret
+    """
+    def __init__(self, open_warehouse, secrets: SecretCache, secret_id: str):
+        self.__open_warehouse = open_warehouse
+        self.__secrets = secrets
+        self.__secret_id = secret_id
+        self.__warehouse = None
+        self.timings = {}
+        self.invocations = {'cold': 0, 'warm': 0, 'reconnect': 0}
+
+    def __healthy(self):
+        try:
+            self.__warehouse.ping()
+            return True
+        except Exception as e:
+            print(f"Warehouse connection is stale ({e}), reconnecting")
+            return False
+
+    def __connect(self):
+        start = time.perf_counter()
+        secret = self.__secrets.get(self.__secret_id)
+        secret_seconds = time.perf_counter() - start
+        try:
+            self.__warehouse = self.__open_warehouse(secret)
+        except Exception:
+            # credentials may have been rotated, fetch them again on the next attempt
+            self.__secrets.invalidate(self.__secret_id)
+            raise
+        return secret_seconds
+
+    def warehouse(self):
+        """
+        returns a live warehouse, reusing the connection of a previous invocation when possible
+        """
+        start = time.perf_counter()
+        if self.__warehouse is None:
+            kind, secret_seconds = 'cold', self.__connect()
+        elif self.__healthy():
+            kind, secret_seconds = 'warm', 0.0
+        else:
+            self.close()
+            kind, secret_seconds = 'reconnect', self.__connect()
+        self.invocations[kind] += 1
+        self.timings = {
+            'connection': kind,
+            'secret_seconds': round(secret_seconds, 3),
+            'ready_seconds': round(time.perf_counter() - start, 3),
+            'invocations': dict(self.invocations),
+        }
+        return self.__warehouse
+
+    def close(self):
+        if self.__warehouse is not None:
+            try:
+                self.__warehouse.close()
+            except Exception:
+                pass
+            self.__warehouse = None
@@ -0,0 +1,106 @@
+import json
+
+from warehouse import Warehouse
+
+
+class KeyMap():
+    """
+    Cached natural key -> surrogate key map of a dimension table, persisted between runs
+    table: dimension table name
+    natural_key: SQL expression of the natural key (a string), e.g. category_name
+    surrogate_key: surrogate key column
+    incremental: the surrogate key is generated in increasing order, so new rows are fetched
+                 past the watermark (highest surrogate key seen). Otherwise only unseen natural
+                 keys are looked up
+    batch_size: natural keys per IN (...) lookup
+    """
+    def __init__(self, table: str, natural_key: str, surrogate_key: str = 'id', incremental=True, batch_size=1000):
+        self.table = table
+        self.natural_key = natural_key
+        self.surrogate_key = surrogate_key
+        self.incremental = incremental
+        self.batch_size = batch_size
+        self.keys = {}
+        self.watermark = None
+        self.queries = 0
+
+    def dumps(self):
+        return json.dumps({'table': self.table, 'watermark': self.watermark, 'keys': self.keys})
+
+    def loads(self, body):
+        """
+        Restore a map saved with dumps, maps of another table are ignored
+        """
+        state = json.loads(body)
+        if state.get('table') == self.table:
+            self.keys = state['keys']
+            self.watermark = state['watermark']
+
+    def __query(self, warehouse: Warehouse, sql: str, params=None):
+        self.queries += 1
+        return warehouse.query(sql, params)
+
+    def __reset(self):
+        self.keys = {}
+        self.watermark = None
+
+    def refresh(self, warehouse: Warehouse):
+        """
+        Fetch the rows added since the watermark. The whole map is reloaded when the table
+        shrank or its ids went back (table recreated). Maps that are not incremental only hold
+        looked up keys, they are dropped when the table has fewer rows than the map (recreated or truncated)
+        """
+        if not self.incremental:
+            count = int(self.__query(warehouse, f"SELECT COUNT(*) FROM {self.table}").iloc[0, 0])
+            if count < len(self.keys):
+                print(f"Key map of {self.table} is stale, reloading")
+                self.__reset()
+            return
+        stats = self.__query(warehouse, f"SELECT MAX({self.surrogate_key}), COUNT(*) FROM {self.table}")
+        max_id, count = stats.iloc[0, 0], int(stats.iloc[0, 1])
+        if count < len(self.keys) or (self.watermark is not None and (max_id is None or max_id < self.watermark)):
+            print(f"Key map of {self.table} is stale, reloading")
+            self.__reset()
+        if count == len(self.keys):
+            return
+
+        query = f"SELECT {self.surrogate_key}, {self.natural_key} FROM {self.table}"
+        params = None
+        if self.watermark is not None:
+            query += f" WHERE {self.surrogate_key} > {warehouse.placeholder}"
+            params = [self.watermark]
+        rows = self.__query(warehouse, query, params)
+        self.__add(rows)
+
+    def __add(self, rows):
+        self.add({
+            natural: surrogate.item() if hasattr(surrogate, 'item') else surrogate
+            for surrogate, natural in rows.itertuples(index=False)
+        })
+
+    def add(self, keys: dict):
+        """
+        Record keys written by the caller
+        """
+        for natural, surrogate in keys.items():
+            self.keys[str(natural)] = surrogate
+            if self.incremental and (self.watermark is None or surrogate > self.watermark):
+                self.watermark = surrogate
+
+    def lookup(self, warehouse: Warehouse, natural_keys):
+        """
+        Returns {natural key: surrogate key} of the natural keys present in the table,
+        only the keys missing from the map are queried, in batches of batch_size
+        """
+        natural_keys = [str(key) for key in set(natural_keys)]
+        missing = [key for key in natural_keys if key not in self.keys]
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            markers = ', '.join([warehouse.placeholder] * len(batch))
+            rows = self.__query(
+                warehouse,
+                f"SELECT {self.surrogate_key}, {self.natural_key} FROM {self.table} WHERE {self.natural_key} IN ({markers})",
+                batch
+            )
+            self.__add(rows)
+        return {key: self.keys[key] for key in natural_keys if key in self.keys}
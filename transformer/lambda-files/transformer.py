@@ -2,158 +2,413 @@ import os
 import json
 import boto3
 import pandas as pd
-from snowflake.connector import connect, SnowflakeConnection
 import datetime
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from warehouse import Warehouse, SnowflakeWarehouse
+from keymap import KeyMap
+from connections import SecretCache, ConnectionManager
+from nike_schema import PRODUCT_FIELDS, SALES_FIELDS, FACT_SALES_FIELDS, column_names, read_dtypes, coerce, validate
+from nike_metrics import Metrics
+
+# pyarrow is only required for parquet lake files (AWS SDK for pandas Lambda layer)
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
 
 s3 = boto3.client('s3')
 secrets_client = boto3.client('secretsmanager')
 S3_BUCKET = os.getenv('S3_BUCKET')
 
-# Retrieve credentials from AWS Secrets Manager
-def get_secrets():
-    secret_name = "nike-project-secrets"
-    get_secret_value_response = secrets_client.get_secret_value(
-            SecretId=secret_name
-        )
-    secret = get_secret_value_response['SecretString']
-    return secret
+# Columns of the lake files used by the transformer, read with the dtypes of the shared schema
+# (dates are parsed per chunk)
+PRODUCT_COLUMNS = ['UID', 'productID', 'title', 'subtitle', 'category']
+PRODUCT_DTYPES = read_dtypes(PRODUCT_FIELDS, PRODUCT_COLUMNS)
+SALES_COLUMNS = ['ticket_id', 'UID', 'sales', 'quantity', 'date']
+SALES_DTYPES = read_dtypes(SALES_FIELDS, SALES_COLUMNS)
+
+# Columns of fact_sales
+FACT_COLUMNS = column_names(FACT_SALES_FIELDS)
+
+# Rows of a sales file parsed at a time
+CHUNK_ROWS = 50000
+
+# Years seeded into DIM_TIME by DDL.sql, dates outside are added by the load that needs them
+CALENDAR_FIRST_YEAR = 2020
+CALENDAR_LAST_YEAR = 2035
+
+# Files downloaded and parsed at the same time
+DOWNLOAD_WORKERS = 8
 
-def read_table(conn: SnowflakeConnection, table_name: str):
+# Where the dimension key maps are kept between runs
+KEYMAP_PREFIX = 'cache/keymaps'
+
+def new_keymaps():
     """
-    Read table content from Snowflake
+    Key maps of the dimensions: category name -> id, product id (date ids are computed, see date_id)
     """
-    query = f"SELECT * FROM {table_name}"
-    df = pd.read_sql(query, conn)
-    return df
+    return {
+        'DIM_CATEGORIES': KeyMap('DIM_CATEGORIES', 'category_name'),
+        'DIM_PRODUCTS': KeyMap('DIM_PRODUCTS', 'id', incremental=False),
+    }
 
-def write_category_table(conn: SnowflakeConnection, new_items: list, table_name: str):
+def load_keymaps(bucket_name: str):
     """
-    Dump dataframe content into Snowflake table
+    Read the key maps saved by previous runs, missing ones start empty
     """
-    with conn.cursor() as cursor:
-        query = f"INSERT INTO {table_name} (category_name) VALUES (%s)"
+    keymaps = new_keymaps()
+    for table, keymap in keymaps.items():
+        try:
+            obj = s3.get_object(Bucket=bucket_name, Key=f'{KEYMAP_PREFIX}/{table}.json')
+        except s3.exceptions.NoSuchKey:
+            continue
+        keymap.loads(obj['Body'].read())
+    return keymaps
+
+def save_keymaps(bucket_name: str, keymaps: dict):
+    for table, keymap in keymaps.items():
+        s3.put_object(Bucket=bucket_name, Key=f'{KEYMAP_PREFIX}/{table}.json', Body=keymap.dumps().encode('utf-8'))
 
-        cursor.executemany(query, new_items)
+# Retrieve credentials from AWS Secrets Manager, kept for 15 minutes by warm containers
+SECRET_NAME = "nike-project-secrets"
+secrets = SecretCache(secrets_client, ttl=900)
 
-def write_products_table(conn: SnowflakeConnection, new_items, table_name: str):
+def open_warehouse(secret_dict: dict):
     """
-    Write products dataframe content into Snowflake table
+    Open an authenticated Snowflake connection
     """
-    with conn.cursor() as cursor:
-        query = f"INSERT INTO {table_name} (id, category_id, title, subtitle) VALUES (%s, %s, %s, %s)"
-        
-        data = new_items[['productID', 'ID', 'title', 'subtitle']].drop_duplicates().values.tolist()
-        cursor.executemany(query, data)
+    connection = SnowflakeWarehouse.connect(
+        account=os.environ.get("ACCOUNT"),
+        user=secret_dict['sfUser'],
+        password=secret_dict['sfPassword'],
+        database=os.environ.get("DATABASE"),
+        schema=os.environ.get("SCHEMA"),
+        warehouse=os.environ.get("WAREHOUSE"),
+        region=os.environ.get("REGION")
+    )
+    return SnowflakeWarehouse(connection)
+
+# Warehouse connection reused across warm invocations of the container
+connections = ConnectionManager(open_warehouse, secrets, SECRET_NAME)
+# One EMF record per invocation, METRICS_SINK=off disables it
+metrics = Metrics.from_env({'Function': 'transformer'})
 
-def write_time_table(conn: SnowflakeConnection, date, table_name: str):
+def write_category_table(warehouse: Warehouse, new_items: list, table_name: str):
     """
-    Write datetime dataframe content into Snowflake table
+    Bulk load new categories into the warehouse table
     """
-    with conn.cursor() as cursor:
-        query = f"INSERT INTO {table_name} (year, month, day) VALUES (%s, %s, %s)"
-        
-        cursor.executemany(query, [[date.strftime('%Y'), date.strftime('%m'), date.strftime('%d')]])
+    data = pd.DataFrame({'category_name': new_items})
+    warehouse.bulk_load(table_name, data, ['category_name'])
 
-def write_sales_table(conn: SnowflakeConnection, new_items, table_name: str):
+def write_products_table(warehouse: Warehouse, new_items, table_name: str):
     """
-    Write sales dataframe content into Snowflake table
+    Bulk load products dataframe content into the warehouse table
     """
-    with conn.cursor() as cursor:
-        query = f"INSERT INTO {table_name} (ticket_id, product_id, sales, quantity, date_id) VALUES (%s, %s, %s, %s, %s)"
-        
-        data = new_items[['ticket_id', 'productID', 'sales', 'quantity', 'date_id']].drop_duplicates().values.tolist()
-        cursor.executemany(query, data)
+    data = new_items[['productID', 'ID', 'title', 'subtitle']].drop_duplicates()
+    data.columns = ['id', 'category_id', 'title', 'subtitle']
+    # the category id turns into a float after the left join, COPY expects an integer
+    data = data.astype({'category_id': 'int64'})
+    warehouse.bulk_load(table_name, data, list(data.columns))
 
-# Having a CSV file in a S3 bucket, read it and generate a dataframe
-def read_csv_from_s3(bucket_name: str, file_name: str):
-    obj = s3.get_object(Bucket=bucket_name, Key=file_name)
-    df = pd.read_csv(obj['Body'])
-    return df
+def date_id(dates):
+    """
+    Deterministic dim_time key of dates (a datetime series): the YYYYMMDD integer
+    """
+    return (dates.dt.year * 10000 + dates.dt.month * 100 + dates.dt.day).astype('int32')
 
-def lambda_handler(event, context):
-    print(event)
-    products_target = event['products_target']
-    sales_target = event['sales_target']
+def write_calendar_table(warehouse: Warehouse, dates: list, table_name: str):
+    """
+    Write dates into the calendar dimension with their deterministic ids, rows of those
+    dates are replaced so seeding twice does not duplicate them
+    """
+    data = pd.DataFrame({'date': pd.to_datetime(pd.Series(dates)).drop_duplicates()})
+    data = pd.DataFrame({
+        'id': date_id(data['date']), 'year': data['date'].dt.year, 'month': data['date'].dt.month, 'day': data['date'].dt.day
+    })
+    for start in range(0, len(data), 1000):
+        ids = data['id'].iloc[start:start + 1000].tolist()
+        markers = ', '.join([warehouse.placeholder] * len(ids))
+        warehouse.execute(f"DELETE FROM {table_name} WHERE id IN ({markers})", ids)
+    warehouse.bulk_load(table_name, data, ['id', 'year', 'month', 'day'])
+
+def read_object_versions(bucket_name: str, keys: list):
+    """
+    Returns {key: ETag} of lake objects, a regenerated sales file gets a new ETag under the same key
+    """
+    return {key: s3.head_object(Bucket=bucket_name, Key=key)['ETag'] for key in keys}
+
+def read_loaded_files(warehouse: Warehouse, versions: dict, table_name: str):
+    """
+    Returns the source files ({source file: ETag}) recorded in the load ledger with the same ETag,
+    a file loaded with another ETag was overwritten since and has to be loaded again
+    """
+    if len(versions) == 0:
+        return set()
+    markers = ', '.join([warehouse.placeholder] * len(versions))
+    query = f"SELECT source_file, etag FROM {table_name} WHERE source_file IN ({markers})"
+    ledger = warehouse.query(query, list(versions))
+    return {source for source, etag in zip(ledger['SOURCE_FILE'], ledger['ETAG']) if etag is not None and etag == versions[source]}
+
+def write_ledger_table(warehouse: Warehouse, row_counts: dict, table_name: str, versions: dict = None):
+    """
+    Record the loaded source files, their ETag (versions) and row counts in the load ledger,
+    replacing the entries of files loaded before
+    """
+    if len(row_counts) == 0:
+        return
+    versions = versions or {}
+    markers = ', '.join([warehouse.placeholder] * len(row_counts))
+    warehouse.execute(f"DELETE FROM {table_name} WHERE source_file IN ({markers})", list(row_counts))
+    data = pd.DataFrame({
+        'source_file': list(row_counts.keys()),
+        'etag': [versions.get(source) for source in row_counts],
+        'row_count': list(row_counts.values()),
+        'loaded_at': datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+    })
+    warehouse.bulk_load(table_name, data, list(data.columns))
+
+def delete_sales_partitions(warehouse: Warehouse, date_ids: list, table_name: str):
+    """
+    Delete the fact rows of the given dates, so a date partition is replaced instead of duplicated
+    """
+    markers = ', '.join([warehouse.placeholder] * len(date_ids))
+    warehouse.execute(f"DELETE FROM {table_name} WHERE date_id IN ({markers})", list(date_ids))
 
-    df = read_csv_from_s3(S3_BUCKET, products_target)
-    df_sales = read_csv_from_s3(S3_BUCKET, sales_target)
+def write_aggregate_tables(warehouse: Warehouse, date_ids: list):
+    """
+    Rebuild the daily aggregates of the given dates from their fact_sales partitions,
+    the reports of deliverable3.sql read these tables instead of fact_sales
+    """
+    markers = ', '.join([warehouse.placeholder] * len(date_ids))
+    params = list(date_ids)
+    warehouse.execute(f"DELETE FROM AGG_SALES_PRODUCT_DAILY WHERE date_id IN ({markers})", params)
+    warehouse.execute(
+        "INSERT INTO AGG_SALES_PRODUCT_DAILY (product_id, date_id, total_sales, total_quantity, tickets) "
+        "SELECT product_id, date_id, SUM(sales), SUM(quantity), COUNT(*) FROM FACT_SALES "
+        f"WHERE date_id IN ({markers}) GROUP BY product_id, date_id",
+        params
+    )
+    warehouse.execute(f"DELETE FROM AGG_SALES_CATEGORY_DAILY WHERE date_id IN ({markers})", params)
+    warehouse.execute(
+        "INSERT INTO AGG_SALES_CATEGORY_DAILY (category_id, date_id, total_sales, total_quantity, tickets) "
+        "SELECT dp.category_id, apd.date_id, SUM(apd.total_sales), SUM(apd.total_quantity), SUM(apd.tickets) "
+        "FROM AGG_SALES_PRODUCT_DAILY apd LEFT JOIN DIM_PRODUCTS dp ON apd.product_id = dp.id "
+        f"WHERE apd.date_id IN ({markers}) GROUP BY dp.category_id, apd.date_id",
+        params
+    )
+
+# Having a CSV or Parquet file in a S3 bucket, read it and generate a dataframe
+def read_csv_from_s3(bucket_name: str, file_name: str, columns: list = None, dtypes: dict = None):
+    """
+    Read a lake file, only the projected columns are decoded
+    """
+    return pd.concat(iter_csv_from_s3(bucket_name, file_name, columns, dtypes), ignore_index=True)
+
+def iter_csv_from_s3(bucket_name: str, file_name: str, columns: list = None, dtypes: dict = None, chunk_rows: int = CHUNK_ROWS, etag: str = None):
+    """
+    Yield a lake file in dataframes of chunk_rows rows. CSV bodies are streamed from S3 and parsed
+    with explicit dtypes. Parquet needs a seekable file (the footer is at the end), the body is streamed
+    to a temporary file in /tmp and decoded from there a batch at a time, then the file is removed.
+    etag: read that version of the object only (the read fails if it was overwritten since)
+    """
+    obj = s3.get_object(Bucket=bucket_name, Key=file_name, **({'IfMatch': etag} if etag else {}))
+    if file_name.endswith('.parquet'):
+        if pq is None:
+            raise ImportError("pyarrow is required to read parquet files")
+        local = tempfile.NamedTemporaryFile(suffix='.parquet', delete=False)
+        try:
+            with local:
+                shutil.copyfileobj(obj['Body'], local, 1024 * 1024)
+            parquet = pq.ParquetFile(local.name)
+            for batch in parquet.iter_batches(batch_size=chunk_rows, columns=columns):
+                df = batch.to_pandas()
+                yield df.astype(dtypes) if dtypes else df
+        finally:
+            os.remove(local.name)
+    else:
+        yield from pd.read_csv(obj['Body'], usecols=columns, dtype=dtypes, chunksize=chunk_rows)
+
+def read_manifest(bucket_name: str, manifest_key: str):
+    """
+    Read the manifest of the objects written by a scraper run
+    """
+    obj = s3.get_object(Bucket=bucket_name, Key=manifest_key)
+    return json.loads(obj['Body'].read())
+
+def read_objects(bucket_name: str, products_target: str, sales_targets: list, versions: dict = None):
+    """
+    Returns the products dataframe and {sales file: iterator of sales chunks}, the sales files
+    are only downloaded when their chunks are consumed (the version of versions when given)
+    """
+    versions = versions or {}
+    df = read_csv_from_s3(bucket_name, products_target, PRODUCT_COLUMNS, PRODUCT_DTYPES)
+    validate(df, PRODUCT_FIELDS, PRODUCT_COLUMNS)
+    sales_files = {
+        target: iter_csv_from_s3(bucket_name, target, SALES_COLUMNS, SALES_DTYPES, etag=versions.get(target))
+        for target in sales_targets
+    }
+    return df, sales_files
+
+def load(warehouse: Warehouse, df, sales_files: dict, keymaps: dict = None, workers: int = DOWNLOAD_WORKERS, metrics: Metrics = None, versions: dict = None):
+    """
+    Load a products dataframe and sales files ({source file: iterable of sales dataframes}) into
+    the dimensions and the fact table. Up to workers sales files are streamed at the same time,
+    chunk by chunk, into staged files loaded with a single COPY. The dates of the sales are replaced
+    (delete then insert), their daily aggregates rebuilt and the files recorded in the load ledger,
+    so loading a file again does not duplicate its sales.
+    keymaps: dimension key maps (new_keymaps), only keys they miss are queried from the warehouse
+    metrics: Metrics receiving the stage timings and row counts (no-op by default)
+    versions: {source file: ETag} recorded in the load ledger
+    """
+    keymaps = keymaps or new_keymaps()
+    metrics = metrics or Metrics()
+    categories = keymaps['DIM_CATEGORIES']
+    products = keymaps['DIM_PRODUCTS']
 
     # Extract distinct values from column 'category' from df dataframe
     df_new_categories = df['category'].unique()
     # Extract 'UID', 'productID', 'title', 'subtitle' and 'category' from df dataframe
     df_products = df[['UID', 'productID', 'title', 'subtitle', 'category']]
 
-    # Obtain credentials from AWS Secrets Manager
-    secret = get_secrets()
-    # Transform secret string into dictionary
-    secret_dict = json.loads(secret)
-    
-    with connect(
-        account=os.environ.get("ACCOUNT"),
-        user=secret_dict['sfUser'],
-        password=secret_dict['sfPassword'],
-        database=os.environ.get("DATABASE"),
-        schema=os.environ.get("SCHEMA"),
-        warehouse=os.environ.get("WAREHOUSE"),
-        region=os.environ.get("REGION")
-    ) as connection:
-        
-        df_old_categories = read_table(connection, "DIM_CATEGORIES")
-        
-        # From df_new_categories, remove the values present in df_old_categories
-        new_categories = list(set(df_new_categories) - set(df_old_categories['CATEGORY_NAME']))
-        
-        if len(new_categories) > 0:
-            print("New categories found: ", new_categories)
-            write_category_table(connection, new_categories, "DIM_CATEGORIES")
+    with metrics.stage('Dimensions'):
+        # Fetch the categories added since the last run
+        categories.refresh(warehouse)
+
+        # From df_new_categories, remove the categories already in the warehouse
+        new_categories = list(set(df_new_categories) - set(categories.keys))
 
-        # Read updated categories table
-        df_updated_categories = read_table(connection, "DIM_CATEGORIES")
+        if len(new_categories) > 0:
+            write_category_table(warehouse, new_categories, "DIM_CATEGORIES")
+            categories.refresh(warehouse)
 
-        # Read existing products dimension table
-        df_existing_products = read_table(connection, "DIM_PRODUCTS")
+        # Add the category id to df_products
+        df_products = df_products.assign(ID=df_products['category'].astype('object').map(categories.keys)).dropna()
 
-        # Join df_products with df_updated_categories on 'category' = 'category_name'
-        df_products = df_products.merge(df_updated_categories, left_on=['category'], right_on=['CATEGORY_NAME'], how='left').dropna()
+        # Look up the products of the file missing from the key map (dropped if DIM_PRODUCTS was emptied)
+        products.refresh(warehouse)
+        existing_products = products.lookup(warehouse, df_products['productID'])
 
-        # From df_products, remove the values present in df_existing_categories
-        df_new_products = df_products[~df_products['productID'].isin(df_existing_products['ID'])]
+        # From df_products, remove the products already in the warehouse
+        df_new_products = df_products[~df_products['productID'].isin(existing_products.keys())]
 
         if len(df_new_products) > 0:
-            print("New categories found: ", df_new_products['title'].drop_duplicates().values.tolist())
-            write_products_table(connection, df_new_products, "DIM_PRODUCTS")
+            write_products_table(warehouse, df_new_products, "DIM_PRODUCTS")
+            products.add({product: product for product in df_new_products['productID']})
+
+    # UID -> product id, replaces the join of the sales with df_products
+    uid_products = df_products.drop_duplicates('UID').set_index('UID')['productID']
+    metrics.add('NewCategories', len(new_categories))
+    metrics.add('NewProducts', df_new_products['productID'].nunique())
+    metrics.add('ProductRowsIn', len(df))
+    metrics.add('ProductRowsOut', len(uid_products))
+    metrics.set('DedupRatio', round(1 - len(uid_products) / len(df), 4) if len(df) else 0.0)
 
-        # Write date into dim_time table
-        # From df_sales, transform 'date' column to datetime
-        df_sales['date'] = pd.to_datetime(df_sales['date'])
-        date = df_sales['date'][0]
-        write_time_table(connection, date, "DIM_TIME")
+    def stage_sales(chunks):
+        """
+        Transform the chunks of a sales file into fact rows and stage them,
+        returns (staged path, rows, {date id: date})
+        """
+        file_dates = {}
+        rows = 0
+        unmatched = 0
 
-        # Read updated time dimension table
-        df_dim_time = read_table(connection, "DIM_TIME")
+        def fact_chunks():
+            nonlocal rows, unmatched
+            for chunk in chunks:
+                chunk = coerce(chunk, SALES_FIELDS)
+                validate(chunk, SALES_FIELDS, SALES_COLUMNS)
+                chunk_ids = date_id(chunk['date'])
+                chunk_dates = pd.DataFrame({'id': chunk_ids, 'date': chunk['date']}).drop_duplicates('id')
+                file_dates.update(zip(chunk_dates['id'].tolist(), chunk_dates['date']))
+                product_ids = chunk['UID'].map(uid_products)
+                rows += len(chunk)
+                unmatched += int(product_ids.isna().sum())
+                yield coerce(pd.DataFrame({
+                    'ticket_id': chunk['ticket_id'],
+                    'product_id': product_ids,
+                    'sales': chunk['sales'],
+                    'quantity': chunk['quantity'],
+                    'date_id': chunk_ids,
+                }), FACT_SALES_FIELDS)
 
-        # From df_sales, drop 'currency' column
-        df_sales = df_sales.drop(columns=['currency'])
+        path = warehouse.stage(fact_chunks(), FACT_COLUMNS)
+        metrics.add('SalesRowsIn', rows)
+        metrics.add('UnmatchedSales', unmatched)
+        metrics.add('StagedBytes', os.path.getsize(path), 'Bytes')
+        return path, rows, file_dates
 
-        # From df_sales, transform 'date' column to three separate columns: year, month and day
-        df_sales['year'] = df_sales['date'].dt.year
-        df_sales['month'] = df_sales['date'].dt.month
-        df_sales['day'] = df_sales['date'].dt.day
+    with metrics.stage('StageSales'), \
+            ThreadPoolExecutor(max_workers=max(1, min(workers, len(sales_files)))) as pool:
+        futures = {source: pool.submit(stage_sales, chunks) for source, chunks in sales_files.items()}
+
+    # The pool is drained, so the files staged before a failure can be removed
+    staged = {source: future.result() for source, future in futures.items() if future.exception() is None}
+    paths = [path for path, _, _ in staged.values()]
+    sales_dates = {day_id: day for _, _, file_dates in staged.values() for day_id, day in file_dates.items()}
+    date_partitions = sorted(sales_dates)
+    try:
+        for future in futures.values():
+            future.result()
+        # Dates past the seeded calendar are added to dim_time
+        outside = [day for day in sales_dates.values() if not CALENDAR_FIRST_YEAR <= day.year <= CALENDAR_LAST_YEAR]
+        if len(outside) > 0:
+            write_calendar_table(warehouse, outside, "DIM_TIME")
+        # Replace the date partitions of the files into fact_sales table
+        with metrics.stage('CopyFacts'):
+            if len(date_partitions) > 0:
+                delete_sales_partitions(warehouse, date_partitions, "FACT_SALES")
+            if len(paths) > 0:
+                warehouse.copy_staged("FACT_SALES", paths, FACT_COLUMNS)
+        # Daily aggregates of the replaced dates
+        with metrics.stage('RefreshAggregates'):
+            if len(date_partitions) > 0:
+                write_aggregate_tables(warehouse, date_partitions)
+    finally:
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+    write_ledger_table(warehouse, {source: rows for source, (_, rows, _) in staged.items()}, "LOAD_LEDGER", versions)
+    metrics.add('SalesRowsOut', sum(rows for _, rows, _ in staged.values()))
+    metrics.add('SalesDates', len(date_partitions))
+    metrics.add('DimensionQueries', sum(keymap.queries for keymap in keymaps.values()))
+
+def lambda_handler(event, context):
+    print(event)
+    # Drops what a failed warm invocation left behind
+    metrics.reset()
+    # Runs without a manifest only produced one sales file
+    if 'manifest' in event:
+        manifest = read_manifest(S3_BUCKET, event['manifest'])
+        products_target, sales_targets = manifest['products'], manifest['sales']
+    else:
+        products_target, sales_targets = event['products_target'], [event['sales_target']]
 
-        # Join df_sales with df_dim_time on 'year', 'month' and 'day'
-        df_sales = df_sales.merge(df_dim_time, left_on=['year', 'month', 'day'], right_on=['YEAR', 'MONTH', 'DAY'], how='left')
+    # Live warehouse connection, opened with the cached credentials on cold starts
+    with metrics.stage('Connect'):
+        warehouse = connections.warehouse()
+    metrics.property('Connection', connections.timings)
 
-        # In df_sales, drop columns 'date', 'year', 'month' and 'day'
-        df_sales = df_sales.drop(columns=['date', 'year', 'month', 'day','YEAR', 'MONTH', 'DAY'])
-        # In df_sales, rename column 'ID' to 'date_id'
-        df_sales = df_sales.rename(columns={'ID': 'date_id'})
+    # Files of the ledger with the same ETag were loaded by a previous attempt, replays skip their sales.
+    # Overwritten files (same day re-run, overlapping backfill) have a new ETag and are loaded again
+    versions = read_object_versions(S3_BUCKET, sales_targets)
+    loaded_files = read_loaded_files(warehouse, versions, "LOAD_LEDGER")
+    sales_targets = [target for target in sales_targets if target not in loaded_files]
+    metrics.add('SkippedFiles', len(loaded_files))
+    if len(sales_targets) == 0:
+        print("All sales files already loaded: ", sorted(loaded_files))
 
-        # Join df_sales with df_products on 'UID'
-        df_sales = df_sales.merge(df_products, on=['UID'], how='left')
-        df_sales = df_sales.drop(columns=['UID', 'title', 'subtitle', 'category', 'ID', 'CATEGORY_NAME'])
+    # The products of the run are loaded even when its sales were, the dimensions only add what is missing
+    with metrics.stage('ReadProducts'):
+        df, sales_files = read_objects(S3_BUCKET, products_target, sales_targets, versions)
+        keymaps = load_keymaps(S3_BUCKET)
+    metrics.add('SalesFiles', len(sales_files))
 
-        # Write df_sales into fact_sales table
-        write_sales_table(connection, df_sales, "FACT_SALES")
-        print("Number of new sales added to DW: ", len(df_sales))
+    # All the files of the run are loaded or none of them
+    with metrics.stage('WarehouseLoad'), warehouse.transaction():
+        load(warehouse, df, sales_files, keymaps, metrics=metrics, versions=versions)
+    save_keymaps(S3_BUCKET, keymaps)
+    metrics.flush()
     
-    return event
\ No newline at end of file
+    return event
@@ -0,0 +1,258 @@
+import csv
+import gzip
+import os
+import sqlite3
+import tempfile
+import uuid
+from contextlib import contextmanager
+
+import pandas as pd
+
+# Tables of deliverables/DDL.sql for the local backends (ids of categories are generated)
+LOCAL_DDL = [
+    """CREATE TABLE IF NOT EXISTS dim_categories (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        category_name VARCHAR(128)
+    )""",
+    """CREATE TABLE IF NOT EXISTS dim_time (
+        id INTEGER PRIMARY KEY,
+        year INT,
+        month INT,
+        day INT
+    )""",
+    """CREATE TABLE IF NOT EXISTS dim_products (
+        id VARCHAR(128) PRIMARY KEY,
+        category_id INT,
+        title VARCHAR(255),
+        subtitle VARCHAR(255)
+    )""",
+    """CREATE TABLE IF NOT EXISTS fact_sales (
+        ticket_id BIGINT PRIMARY KEY,
+        product_id VARCHAR(128),
+        sales DOUBLE,
+        quantity INT,
+        date_id INT
+    )""",
+    """CREATE TABLE IF NOT EXISTS agg_sales_product_daily (
+        product_id VARCHAR(128),
+        date_id INT,
+        total_sales DOUBLE,
+        total_quantity INT,
+        tickets INT
+    )""",
+    """CREATE TABLE IF NOT EXISTS agg_sales_category_daily (
+        category_id INT,
+        date_id INT,
+        total_sales DOUBLE,
+        total_quantity INT,
+        tickets INT
+    )""",
+    """CREATE TABLE IF NOT EXISTS load_ledger (
+        source_file VARCHAR(512) PRIMARY KEY,
+        etag VARCHAR(128),
+        row_count INT,
+        loaded_at TIMESTAMP
+    )""",
+]
+
+
+def stage_frames(frames, columns: list, directory: str = None):
+    """
+    Write the columns of a dataframe, or of an iterable of dataframes (chunks), into a gzipped
+    CSV staging file, returns its path. Only the chunk being written is held in memory
+    """
+    if isinstance(frames, pd.DataFrame):
+        frames = [frames]
+    path = os.path.join(directory or tempfile.gettempdir(), f'stage_{uuid.uuid4().hex}.csv.gz')
+    try:
+        with gzip.open(path, 'wt', newline='') as staged:
+            header = True
+            for frame in frames:
+                frame[columns].to_csv(staged, index=False, header=header)
+                header = False
+            if header:
+                pd.DataFrame(columns=columns).to_csv(staged, index=False)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+
+class Warehouse():
+    """
+    Warehouse adapter used by the transformer, bulk loads go through staged files
+    placeholder: parameter marker of the driver
+    """
+    placeholder = '%s'
+
+    def query(self, sql: str, params=None):
+        """
+        Run a query and return its result as a dataframe (column names upper case)
+        """
+        raise NotImplementedError
+
+    def execute(self, sql: str, params=None):
+        raise NotImplementedError
+
+    def stage(self, frames, columns: list):
+        """
+        Write dataframes into a staging file for copy_staged, returns its path
+        """
+        return stage_frames(frames, columns)
+
+    def copy_staged(self, table_name: str, paths: list, columns: list):
+        """
+        Load staging files into table_name with a single COPY-style statement, the files are removed
+        """
+        raise NotImplementedError
+
+    def bulk_load(self, table_name: str, df: pd.DataFrame, columns: list):
+        """
+        Load the columns of a dataframe into table_name through a staging file, returns the rows loaded
+        """
+        if len(df) == 0:
+            return 0
+        self.copy_staged(table_name, [self.stage(df, columns)], columns)
+        return len(df)
+
+    def ping(self):
+        """
+        Raise if the connection can not run queries anymore
+        """
+        self.query("SELECT 1")
+
+    def close(self):
+        self.connection.close()
+
+    @contextmanager
+    def transaction(self):
+        self.execute("BEGIN")
+        try:
+            yield self
+        except BaseException:
+            self.execute("ROLLBACK")
+            raise
+        self.execute("COMMIT")
+
+
+class SnowflakeWarehouse(Warehouse):
+    """
+    Snowflake backend, stages a gzipped CSV in the table stage and loads it with COPY INTO
+    """
+    def __init__(self, connection):
+        self.connection = connection
+
+    @staticmethod
+    def connect(**kwargs):
+        """
+        Open a Snowflake connection, the connector is only imported by the Lambda (layer)
+        """
+        from snowflake.connector import connect
+        return connect(**kwargs)
+
+    def ping(self):
+        if self.connection.is_closed():
+            raise ConnectionError("Snowflake connection is closed")
+        self.query("SELECT 1")
+
+    def query(self, sql: str, params=None):
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            columns = [column[0].upper() for column in cursor.description]
+            return pd.DataFrame(cursor.fetchall(), columns=columns)
+
+    def execute(self, sql: str, params=None):
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, params)
+
+    def copy_staged(self, table_name: str, paths: list, columns: list):
+        try:
+            with self.connection.cursor() as cursor:
+                for path in paths:
+                    cursor.execute(f"PUT 'file://{path}' @%{table_name} AUTO_COMPRESS=FALSE OVERWRITE=TRUE")
+                files = ', '.join(f"'{os.path.basename(path)}'" for path in paths)
+                cursor.execute(
+                    f"COPY INTO {table_name} ({', '.join(columns)}) FROM @%{table_name} "
+                    f"FILES = ({files}) "
+                    "FILE_FORMAT = (TYPE = CSV SKIP_HEADER = 1 FIELD_OPTIONALLY_ENCLOSED_BY = '\"' "
+                    "EMPTY_FIELD_AS_NULL = TRUE COMPRESSION = GZIP) "
+                    "PURGE = TRUE"
+                )
+        finally:
+            for path in paths:
+                os.remove(path)
+
+
+class SQLiteWarehouse(Warehouse):
+    """
+    Local SQLite backend to test and benchmark the load path offline.
+    SQLite has no COPY, the staged file is read back and inserted in one transaction
+    """
+    placeholder = '?'
+
+    def __init__(self, database: str = ':memory:'):
+        self.connection = sqlite3.connect(database, isolation_level=None, check_same_thread=False)
+        for ddl in LOCAL_DDL:
+            self.connection.execute(ddl)
+
+    def query(self, sql: str, params=None):
+        cursor = self.connection.execute(sql, params or [])
+        columns = [column[0].upper() for column in cursor.description]
+        return pd.DataFrame(cursor.fetchall(), columns=columns)
+
+    def execute(self, sql: str, params=None):
+        self.connection.execute(sql, params or [])
+
+    def __insert(self, query: str, path: str):
+        with gzip.open(path, 'rt', newline='') as staged:
+            reader = csv.reader(staged)
+            next(reader)
+            self.connection.executemany(query, ([value if value != '' else None for value in row] for row in reader))
+
+    def copy_staged(self, table_name: str, paths: list, columns: list):
+        query = f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+        try:
+            if self.connection.in_transaction:
+                for path in paths:
+                    self.__insert(query, path)
+            else:
+                with self.transaction():
+                    for path in paths:
+                        self.__insert(query, path)
+        finally:
+            for path in paths:
+                os.remove(path)
+
+
+class DuckDBWarehouse(Warehouse):
+    """
+    Local DuckDB backend, loads the staged file with COPY like the Snowflake backend
+    """
+    placeholder = '?'
+
+    def __init__(self, database: str = ':memory:'):
+        import duckdb
+        self.connection = duckdb.connect(database)
+        for ddl in LOCAL_DDL:
+            # DuckDB generates ids from sequences instead of AUTOINCREMENT
+            table = ddl.split()[5]
+            if 'AUTOINCREMENT' in ddl:
+                self.connection.execute(f"CREATE SEQUENCE IF NOT EXISTS seq_{table}")
+                ddl = ddl.replace('INTEGER PRIMARY KEY AUTOINCREMENT', f"INTEGER PRIMARY KEY DEFAULT nextval('seq_{table}')")
+            self.connection.execute(ddl)
+
+    def query(self, sql: str, params=None):
+        df = self.connection.execute(sql, params or []).df()
+        df.columns = [column.upper() for column in df.columns]
+        return df
+
+    def execute(self, sql: str, params=None):
+        self.connection.execute(sql, params or [])
+
+    def copy_staged(self, table_name: str, paths: list, columns: list):
+        try:
+            for path in paths:
+                self.connection.execute(f"COPY {table_name} ({', '.join(columns)}) FROM '{path}' (HEADER, COMPRESSION gzip)")
+        finally:
+            for path in paths:
+                os.remove(path)